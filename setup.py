@@ -14,6 +14,9 @@ setup(
     keywords = "video header formats matroska avi asf quicktime realmedia",
     url = "http://videoparser.googlecode.com/",
 
+    entry_points = {
+        'console_scripts': ['videoparser = videoparser.cli:main'],
+    },
 )
 
 
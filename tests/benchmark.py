@@ -0,0 +1,220 @@
+""" Benchmark the container plugins on the synthetic files of corpus.py,
+    reporting the probes per second and the bytes read per probe.
+
+    Usage: ./benchmark.py [-s seconds] [-t tree] [-m] [-p]
+                          [-d milliseconds [-b blocks]] [case ...]
+
+    Every case is one generated file, either a small file or one with large
+    headers: huge sample tables, many tracks, deeply nested chunks or many
+    header objects. Without arguments all cases are run.
+
+    The tree option points to another checkout of videoparser, to compare
+    the plugins before and after a change on the same files. With -m the
+    files are parsed from memory through parse_bytes, which leaves out the
+    file system, and -p prints the functions the time was spent in.
+
+    With -d every read of a file sleeps the given number of milliseconds,
+    like a read from a mount with a round trip per request, and each case
+    is measured without and with the block cache of -b blocks. This shows
+    for which files the block cache pays off.
+"""
+
+import __builtin__
+import cProfile
+import optparse
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+
+import corpus
+
+
+# Name, generator, sizes
+cases = [
+    ('avi', corpus.make_avi, {}),
+    ('avi-streams', corpus.make_avi, {'streams': 64}),
+    ('avi-nested', corpus.make_avi, {'depth': 200}),
+    ('mkv', corpus.make_mkv, {}),
+    ('mkv-tracks', corpus.make_mkv, {'tracks': 256}),
+    ('mov', corpus.make_mov, {}),
+    ('mov-tracks', corpus.make_mov, {'tracks': 64}),
+    ('mov-samples', corpus.make_mov, {'tracks': 2, 'samples': 500000}),
+    ('asf', corpus.make_asf, {}),
+    ('asf-streams', corpus.make_asf, {'streams': 64}),
+    ('asf-objects', corpus.make_asf, {'ext_objects': 5000}),
+    ('rm', corpus.make_rm, {}),
+    ('rm-streams', corpus.make_rm, {'streams': 64}),
+]
+
+extensions = dict([(generator, extension)
+                   for extension, generator in corpus.generators])
+
+
+def write_cases(directory, selected):
+    """ Write the file of every case to directory, returns a list of
+        (name, filename, data) """
+    files = []
+    for name, generator, sizes in selected:
+        data = generator(**sizes)
+        filename = os.path.join(directory,
+                                '%s.%s' % (name, extensions[generator]))
+        with open(filename, 'wb') as fh:
+            fh.write(data)
+        files.append((name, filename, data))
+    return files
+
+
+class DelayedFile(object):
+    """ File object which sleeps delay seconds on every read. """
+    
+    def __init__(self, fileobj, delay):
+        self._fileobj = fileobj
+        self._delay = delay
+    
+    def read(self, size=-1):
+        time.sleep(self._delay)
+        return self._fileobj.read(size)
+    
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+
+def delay_reads(factory, delay):
+    """ Make the files opened by the streams.factory module a DelayedFile.
+    """
+    def delayed_open(filename, mode='r', buffering=-1):
+        return DelayedFile(__builtin__.open(filename, mode, buffering), delay)
+    factory.open = delayed_open
+
+
+def probe_function(parser, filename, data, memory):
+    if memory:
+        basename = os.path.basename(filename)
+        return lambda: parser.parse_bytes(data, basename)
+    return lambda: parser.parse_file(filename)
+
+
+def measure(probe, seconds):
+    """ Run probe for at least the given number of seconds, returns the
+        probes per second """
+    probe()
+    count = 0
+    start = time.time()
+    elapsed = 0
+    while elapsed < seconds:
+        probe()
+        count += 1
+        elapsed = time.time() - start
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(
+        usage="%prog [-s seconds] [-t tree] [-m] [-p] "
+              "[-d milliseconds [-b blocks]] [case ...]")
+    parser.add_option('-s', '--seconds', type='float', default=1.0,
+                      help="time to spend on each case")
+    parser.add_option('-t', '--tree', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..'))
+    parser.add_option('-m', '--memory', action='store_true',
+                      help="parse the files from memory")
+    parser.add_option('-p', '--profile', action='store_true',
+                      help="profile the cases instead of timing them")
+    parser.add_option('-d', '--delay', type='float',
+                      help="milliseconds every read of a file takes, "
+                           "compares the block cache with no cache")
+    parser.add_option('-b', '--blocks', type='int', default=16,
+                      help="number of blocks of the block cache with -d")
+    parser.add_option('-l', '--list', action='store_true',
+                      help="list the cases")
+    options, args = parser.parse_args()
+    
+    if options.list:
+        for name, generator, sizes in cases:
+            print name
+        sys.exit(0)
+    
+    selected = [case for case in cases if not args or case[0] in args]
+    if not selected:
+        parser.error("no such case, see --list")
+    
+    if options.delay is not None and (options.memory or options.profile):
+        parser.error("-d can't be combined with -m or -p")
+    
+    sys.path.insert(0, os.path.abspath(options.tree))
+    import videoparser
+    import videoparser.streams.factory as factory
+    
+    if options.delay is not None:
+        delay_reads(factory, options.delay / 1000.0)
+    
+    # The parsers print diagnostics, keep them out of the report
+    stdout = sys.stdout
+    
+    directory = tempfile.mkdtemp(prefix='videoparser-benchmark-')
+    try:
+        files = write_cases(directory, selected)
+        
+        video_parser = videoparser.VideoParser()
+        counting_parser = videoparser.VideoParser(io_stats=True)
+        
+        if options.delay is not None:
+            print "%-12s %-10s %10s %12s %12s %8s %8s" % (
+                'case', 'container', 'size', 'no cache/s', 'cache/s',
+                'reads', 'misses')
+        elif not options.profile:
+            print "%-12s %-10s %10s %12s %12s %8s" % (
+                'case', 'container', 'size', 'probes/s', 'bytes read',
+                'reads')
+        
+        for name, filename, data in files:
+            sys.stdout = sys.stderr
+            try:
+                video = probe_function(counting_parser, filename, data,
+                                       options.memory)()
+                probe = probe_function(video_parser, filename, data,
+                                       options.memory)
+                if options.profile:
+                    profile = cProfile.Profile()
+                    profile.runcall(measure, probe, options.seconds)
+                else:
+                    rate = measure(probe, options.seconds)
+                
+                if options.delay is not None:
+                    factory.cache_blocks = options.blocks
+                    try:
+                        cached = probe_function(counting_parser, filename,
+                                                data, False)()
+                        cache_rate = measure(probe, options.seconds)
+                    finally:
+                        factory.cache_blocks = 0
+            finally:
+                sys.stdout = stdout
+            
+            if options.profile:
+                print "Case %s:" % name
+                stats = pstats.Stats(profile, stream=stdout)
+                stats.strip_dirs()
+                stats.sort_stats('time', 'calls')
+                stats.print_stats(15)
+                continue
+            
+            if video is None:
+                print "%-12s failed" % name
+                continue
+            
+            if options.delay is not None:
+                print "%-12s %-10s %10d %12.1f %12.1f %8d %8d" % (
+                    name, video.as_dict()['container'] or '-', len(data),
+                    rate, cache_rate, video.io_stats.reads,
+                    cached.io_stats.cache_misses)
+                continue
+            
+            print "%-12s %-10s %10d %12.1f %12d %8d" % (
+                name, video.as_dict()['container'] or '-', len(data), rate,
+                video.io_stats.bytes_read, video.io_stats.reads)
+    finally:
+        shutil.rmtree(directory)
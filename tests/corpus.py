@@ -0,0 +1,286 @@
+""" Generators of synthetic but valid headers for every container plugin,
+    used by benchmark.py so no media files are needed.
+
+    Each make_* function returns the data of a small file with the headers
+    the parser reads, the parameters set the size of the headers:
+
+        make_avi(streams, depth)        depth nested LIST chunks in hdrl
+        make_mkv(tracks)
+        make_mov(tracks, samples)       samples entries per stts table
+        make_asf(streams, ext_objects)  objects in the header extension
+        make_rm(streams)
+
+    Or from the command line: ./corpus.py <directory>, which writes a file
+    for every container.
+"""
+
+import os
+import struct
+import sys
+
+
+def le(format, *values):
+    return struct.pack('<' + format, *values)
+
+def be(format, *values):
+    return struct.pack('>' + format, *values)
+
+
+# AVI
+
+def riff_chunk(id, data):
+    padding = len(data) % 2 and '\x00' or ''
+    return id + le('I', len(data)) + data + padding
+
+def riff_list(type, data):
+    return 'LIST' + le('I', len(data) + 4) + type + data
+
+def make_avi(streams=2, depth=0):
+    body = riff_chunk('avih', le('14I', 40000, 0, 0, 0, 1000, 0, streams, 0,
+                                 640, 480, 0, 0, 0, 0))
+    for i in range(streams):
+        if i % 2 == 0:
+            strh = 'vids' + 'XVID' + le('IHHIIIIIIIIhhhh', 0, 0, 0, 0, 1, 25,
+                                        0, 1000, 0, 0, 0, 0, 0, 640, 480)
+            strf = (le('IiiHH', 40, 640, 480, 1, 24) + 'XVID' +
+                    le('5I', 0, 0, 0, 0, 0))
+        else:
+            strh = 'auds' + '\x00' * 4 + le(
+                'IHHIIIIIIIIhhhh', 0, 0, 0, 0, 1, 44100, 0, 1000, 0, 0, 0,
+                0, 0, 0, 0)
+            strf = le('HHIIHHH', 0x55, 2, 44100, 16000, 4, 16, 0)
+        body += riff_list('strl', riff_chunk('strh', strh) +
+                          riff_chunk('strf', strf))
+
+    nested = riff_chunk('JUNK', 'x' * 4)
+    for i in range(depth):
+        nested = riff_list('JUNK', nested)
+    if depth:
+        body += nested
+
+    data = ('AVI ' + riff_list('hdrl', body) +
+            riff_list('movi', riff_chunk('00dc', 'x' * 100)))
+    return 'RIFF' + le('I', len(data)) + data
+
+
+# Matroska
+
+def ebml_size(size, length=None):
+    if length is None:
+        length = 1
+        while size >= (1 << (7 * length)) - 1:
+            length += 1
+    return be('Q', size | (1 << (7 * length)))[8 - length:]
+
+def ebml_element(id, data, size_length=None):
+    return (be('I', id).lstrip('\x00') + ebml_size(len(data), size_length) +
+            data)
+
+def ebml_uint(id, value):
+    return ebml_element(id, be('Q', value).lstrip('\x00') or '\x00')
+
+def make_mkv(tracks=2, unknown=False):
+    """ With unknown set the file contains elements which the parser does
+        not know: Tags in the Segment and ContentEncodings in every
+        TrackEntry. """
+    ebml = ebml_element(0x1a45dfa3, ebml_element(0x4282, 'matroska') +
+                        ebml_uint(0x4287, 2) + ebml_uint(0x4285, 2))
+    entries = ''
+    for i in range(tracks):
+        if i % 2 == 0:
+            entry = (ebml_uint(0xD7, i + 1) + ebml_uint(0x83, 1) +
+                     ebml_element(0x86, 'V_MPEG4/ISO/AVC') +
+                     ebml_uint(0x23E383, 41708333) +
+                     ebml_element(0x23314F, be('f', 1.0)) +
+                     ebml_element(0xE0, ebml_uint(0xB0, 1280) +
+                                  ebml_uint(0xBA, 720)))
+        else:
+            entry = (ebml_uint(0xD7, i + 1) + ebml_uint(0x83, 2) +
+                     ebml_element(0x86, 'A_AAC') +
+                     ebml_element(0xE1, ebml_element(0xB5, be('f', 48000.0)) +
+                                  ebml_uint(0x9F, 2)))
+        if unknown:
+            entry += ebml_element(0x6D80, ebml_element(0x6240, ebml_element(
+                0x5034, ebml_uint(0x4254, 3) +
+                ebml_element(0x4255, '\x00\x00\x01'))))
+        entries += ebml_element(0xAE, entry)
+
+    segment = (ebml_element(0x114D9B74, 'x' * 20) +
+               ebml_element(0x1549a966, 'y' * 30))
+    if unknown:
+        segment += ebml_element(0x1254C367, ebml_element(0x7373, ebml_element(
+            0x67C8, ebml_element(0x45A3, 'TITLE') +
+            ebml_element(0x4487, 'Sample'))))
+    segment += (ebml_element(0x1654AE6B, entries, 8) +
+                ebml_element(0x1F43B675, 'z' * 200))
+    return ebml + ebml_element(0x18538067, segment, 8)
+
+
+# QuickTime
+
+def qt_atom(type, data):
+    return be('I', len(data) + 8) + type + data
+
+def make_mov(tracks=2, samples=100):
+    ftyp = qt_atom('ftyp', 'qt  ' + '\x00' * 4 + 'qt  ' + '\x00' * 12)
+    mvhd = qt_atom('mvhd', '\x00' * 4 +
+                   be('IIIIIH', 0, 0, 600, 6000, 0x10000, 0x100) +
+                   '\x00' * 46 + be('7I', 0, 0, 0, 0, 0, 0, tracks + 1))
+
+    # The same time-to-sample table for every track
+    stts = qt_atom('stts', '\x00' * 4 + be('I', samples) +
+                   be('II', 1, 24) * samples)
+
+    traks = ''
+    for i in range(tracks):
+        tkhd = qt_atom('tkhd', '\x00' * 4 + be('IIIII', 0, 0, i + 1, 0, 6000) +
+                       '\x00' * 8 + be('HHH', 0, 0, 0) + '\x00' * 38 +
+                       be('II', 640 << 16, 480 << 16))
+        if i % 2 == 0:
+            subtype = 'vide'
+            entry = ('\x00' * 4 + 'avc1' + '\x00' * 6 + be('HHH', 1, 0, 0) +
+                     'appl' + be('iihhII', 0, 0, 640, 480, 72 << 16, 72 << 16) +
+                     be('ih', 0, 1) + 'avc1' + be('Hh', 24, -1))
+        else:
+            subtype = 'soun'
+            entry = ('\x00' * 4 + 'mp4a' + '\x00' * 6 + be('HHH', 1, 0, 0) +
+                     be('IHHhHI', 0, 2, 16, 0, 0, 44100 << 16))
+
+        hdlr = qt_atom('hdlr', '\x00' * 4 + 'mhlr' + subtype +
+                       be('III', 0, 0, 0) + 'name')
+        stsd = qt_atom('stsd', '\x00' * 4 + be('I', 1) + entry)
+        stbl = qt_atom('stbl', stsd + stts + qt_atom('stsz', '\x00' * 12) +
+                       qt_atom('stco', '\x00' * 8))
+        minf = qt_atom('minf', qt_atom('vmhd', '\x00' * 12) +
+                       qt_atom('dinf', qt_atom('dref', '\x00' * 8)) + stbl)
+        mdia = qt_atom('mdia', qt_atom('mdhd', '\x00' * 24) + hdlr + minf)
+        traks += qt_atom('trak', tkhd + mdia)
+
+    moov = qt_atom('moov', mvhd + traks + qt_atom('udta', 'u' * 10))
+    return ftyp + moov + qt_atom('mdat', 'm' * 1000)
+
+
+# ASF
+
+def asf_guid(text):
+    fields = text.split('-')
+    return (le('IHH', int(fields[0], 16), int(fields[1], 16),
+               int(fields[2], 16)) +
+            fields[3].decode('hex') + fields[4].decode('hex'))
+
+asf_header = asf_guid('75B22630-668E-11CF-A6D9-00AA0062CE6C')
+asf_file_properties = asf_guid('8CABDCA1-A947-11CF-8EE4-00C00C205365')
+asf_stream_properties = asf_guid('B7DC0791-A9B7-11CF-8EE6-00C00C205365')
+asf_header_extension = asf_guid('5FBF03B5-A92E-11CF-8EE3-00C00C205365')
+asf_reserved_1 = asf_guid('ABD3D211-A9BA-11cf-8EE6-00C00C205365')
+asf_extended_stream_properties = asf_guid(
+    '14E6A5CB-C672-4332-8399-A96952065B5A')
+asf_padding = asf_guid('1806D474-CADF-4509-A4BA-9AABCB96AAE8')
+asf_audio_media = asf_guid('F8699E40-5B4D-11CF-A8FD-00805F5C442B')
+asf_video_media = asf_guid('BC19EFC0-5B4D-11CF-A8FD-00805F5C442B')
+asf_no_error_correction = asf_guid('20FB5700-5B55-11CF-A8FD-00805F5C442B')
+asf_codec_list = asf_guid('86D15240-311D-11D0-A3A4-00A0C90348F6')
+
+def asf_object(guid, data):
+    return guid + le('Q', len(data) + 24) + data
+
+def make_asf(streams=2, ext_objects=4):
+    objects = [asf_object(asf_file_properties, asf_no_error_correction +
+                          le('QQQ', 0, 0, 0) + le('QQQ', 123456789, 0, 0) +
+                          le('IIII', 2, 0, 0, 0))]
+    for i in range(streams):
+        if i % 2 == 0:
+            type = asf_video_media
+            type_data = (le('IIBH', 320, 240, 2, 40) +
+                         le('IiiHH', 40, 320, 240, 1, 24) + 'WMV3' +
+                         le('5I', 0, 0, 0, 0, 0))
+        else:
+            type = asf_audio_media
+            type_data = le('HHIIHHH', 0x161, 2, 44100, 16000, 4, 16, 0)
+        objects.append(asf_object(asf_stream_properties, type +
+                                  asf_no_error_correction +
+                                  le('QII', 0, len(type_data), 0) +
+                                  le('H', i + 1) + '\x00' * 4 + type_data))
+
+    objects.append(asf_object(asf_codec_list, asf_no_error_correction +
+                              le('I', 1) + le('HH', 1, 3) +
+                              u'ab\x00'.encode('utf-16-le') + le('H', 2) +
+                              u'c\x00'.encode('utf-16-le') + le('H', 2) +
+                              'ab'))
+
+    extension = ''
+    for i in range(0, streams, 2):
+        extension += asf_object(asf_extended_stream_properties,
+                                le('QQ8I', 0, 0, 0, 0, 0, 0, 0, 0, 0, 0) +
+                                le('HHQHH', i + 1, 0, 400000, 0, 0))
+    extension += asf_object(asf_padding, '\x00' * 16) * ext_objects
+    objects.append(asf_object(asf_header_extension, asf_reserved_1 +
+                              le('HI', 6, len(extension)) + extension))
+
+    body = ''.join(objects)
+    return (asf_header + le('QIBB', len(body) + 30, len(objects), 1, 2) +
+            body)
+
+
+# RealMedia
+
+def rm_object(id, data):
+    return id + be('I', len(data) + 8) + data
+
+def make_rm(streams=2):
+    data = rm_object('.RMF', be('HII', 0, 0, 4))
+    data += rm_object('PROP', be('H9IHH', 0, 1, 1, 1, 1, 1, 60000, 0, 0, 0,
+                                 streams, 0))
+    for i in range(streams):
+        if i % 2 == 0:
+            mime = 'video/x-pn-realvideo'
+            type_data = (be('HH', 0, 34) + 'VIDO' + 'RV40' +
+                         be('HH', 320, 240) + '\x00' * 6 + be('hH', 25, 0))
+        else:
+            mime = 'audio/x-pn-realaudio'
+            type_data = ('.ra\xfd' + be('HH', 4, 0) + '.ra4' +
+                         be('IHIHI', 0, 4, 0, 0, 0) + '\x00' * 12 +
+                         be('HHHH', 0, 0, 0, 0) + be('HHHH', 44100, 0, 16, 2) +
+                         '\x04Int4' + '\x04cook' + '\x00' * 3 + be('I', 0))
+        name = 'stream%d' % i
+        data += rm_object('MDPR', be('HH7I', 0, i, 1, 1, 1, 1, 0, 0, 60000) +
+                          chr(len(name)) + name + chr(len(mime)) + mime +
+                          be('I', len(type_data)) + type_data)
+    data += rm_object('CONT', be('H', 0) + '\x00' * 8)
+    data += rm_object('DATA', '\x00' * 100)
+    return data
+
+
+# Generator and extension of every container
+generators = [('avi', make_avi), ('mkv', make_mkv), ('mov', make_mov),
+              ('wmv', make_asf), ('rm', make_rm)]
+
+
+def write_corpus(directory, **sizes):
+    """ Write a file for every container to directory and return their
+        filenames. The sizes are passed to the generators which accept
+        them. """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    filenames = []
+    for extension, generator in generators:
+        arguments = generator.func_code.co_varnames[
+            :generator.func_code.co_argcount]
+        data = generator(**dict([(key, value)
+                                 for key, value in sizes.items()
+                                 if key in arguments]))
+        filename = os.path.join(directory, 'sample.' + extension)
+        with open(filename, 'wb') as fh:
+            fh.write(data)
+        filenames.append(filename)
+    return filenames
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "Usage ./corpus.py <directory>"
+        sys.exit(1)
+
+    for filename in write_corpus(sys.argv[1]):
+        print filename
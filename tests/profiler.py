@@ -9,6 +9,7 @@ import videoparser.plugins.quicktime as quicktime
 import videoparser.plugins.avi as avi
 
 import videoparser.videofile
+import videoparser.streams
 
 
 try:
@@ -29,7 +30,9 @@ elif ext in quicktime.Parser._file_types:
 def parse_file(filename):
 
     video = videoparser.videofile.VideoFile()
-    parser.parse(filename, video)
+    with videoparser.streams.factory.create_filestream(
+            filename, parser._endianess) as stream:
+        parser.parse(stream, video)
 
 
 profile_file = 'plugin.prof'
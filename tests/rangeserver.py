@@ -0,0 +1,171 @@
+""" Local HTTP server with Range request support, used as a stand-in for
+    remote storage when testing videoparser.streams.remote.
+
+    Example:
+        server = RangeServer('/path/to/videos')
+        server.start()
+        print server.url('video.mp4')
+        ...
+        print server.requests
+        server.stop()
+
+    Or from the command line: ./rangeserver.py <directory> [port]
+"""
+
+import BaseHTTPServer
+import SocketServer
+import os
+import re
+import socket
+import sys
+import threading
+import urllib
+
+
+class RangeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Buffer the response, the headers are otherwise sent in separate
+    # packets which makes every request wait for a delayed ACK
+    wbufsize = -1
+
+    _range = re.compile(r'bytes=(\d*)-(\d*)$')
+
+    def do_HEAD(self):
+        self._send(head=True)
+
+    def do_GET(self):
+        self._send(head=False)
+
+    def _send(self, head):
+        server = self.server
+        server.count_request(self.path, self.headers.get('range'))
+
+        path = os.path.join(server.root,
+                            urllib.unquote(self.path.split('?')[0]).lstrip('/'))
+        try:
+            fh = open(path, 'rb')
+        except IOError:
+            self.send_error(404)
+            return
+
+        try:
+            fh.seek(0, 2)
+            size = fh.tell()
+
+            start, end = 0, size - 1
+            status = 200
+            match = self._range.match(self.headers.get('range', ''))
+            if match and server.support_ranges:
+                if match.group(1):
+                    start = int(match.group(1))
+                    if match.group(2):
+                        end = min(int(match.group(2)), size - 1)
+                elif match.group(2):
+                    start = max(size - int(match.group(2)), 0)
+
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header('Content-Range', 'bytes */%d' % size)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+
+            self.send_response(status)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            if status == 206:
+                self.send_header('Content-Range',
+                                 'bytes %d-%d/%d' % (start, end, size))
+            self.end_headers()
+
+            if not head:
+                # Sent in blocks, a client which only needs the start of a
+                # complete file closes the connection
+                fh.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = fh.read(min(remaining, 65536))
+                    if not data:
+                        break
+                    try:
+                        self.wfile.write(data)
+                        self.wfile.flush()
+                    except socket.error:
+                        self.close_connection = 1
+                        break
+                    server.count_bytes(len(data))
+                    remaining -= len(data)
+        finally:
+            fh.close()
+
+    def finish(self):
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        except socket.error:
+            # The client closed the connection
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RangeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Serve the files in root on 127.0.0.1 from a background thread and
+        count the requests made. """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root, port=0, support_ranges=True):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port),
+                                           RangeRequestHandler)
+        self.root = root
+        self.support_ranges = support_ranges
+        self.requests = 0
+        self.bytes_sent = 0
+        self.log = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count_request(self, path, range):
+        with self._lock:
+            self.requests += 1
+            self.log.append((path, range))
+
+    def count_bytes(self, count):
+        with self._lock:
+            self.bytes_sent += count
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.log = []
+
+    def url(self, filename):
+        return 'http://127.0.0.1:%d/%s' % (self.server_address[1],
+                                          urllib.quote(filename))
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "Usage ./rangeserver.py <directory> [port]"
+        sys.exit(1)
+
+    port = 8000
+    if len(sys.argv) > 2:
+        port = int(sys.argv[2])
+
+    server = RangeServer(sys.argv[1], port)
+    print "Serving %s on %s" % (sys.argv[1], server.url(''))
+    server.serve_forever()
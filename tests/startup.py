@@ -0,0 +1,69 @@
+""" Measure the cold start cost of videoparser: importing the package,
+    creating a VideoParser and parsing the first file, each run in a fresh
+    interpreter.
+
+    Usage: ./startup.py [-n runs] [-t tree] <filename>
+
+    The tree option points to another checkout of videoparser, to compare
+    the startup time before and after a change.
+"""
+
+import optparse
+import os
+import subprocess
+import sys
+
+
+# Runs in the child interpreter, prints the times in milliseconds
+child_script = """
+import sys, time
+sys.path.insert(0, %(tree)r)
+start = time.time()
+import videoparser
+imported = time.time()
+parser = videoparser.VideoParser()
+created = time.time()
+parser.parse_file(%(filename)r)
+parsed = time.time()
+print (imported - start) * 1000, (created - imported) * 1000, \\
+    (parsed - created) * 1000, len(sys.modules)
+"""
+
+
+def measure(tree, filename, runs):
+    script = child_script % {'tree': tree, 'filename': filename}
+    results = []
+    for i in range(runs):
+        output = subprocess.Popen([sys.executable, '-c', script],
+                                  stdout=subprocess.PIPE).communicate()[0]
+        results.append([float(value) for value in output.split()[-4:]])
+    return results
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) / 2]
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [-n runs] [-t tree] <filename>")
+    parser.add_option('-n', '--runs', type='int', default=20)
+    parser.add_option('-t', '--tree', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..'))
+    options, args = parser.parse_args()
+    
+    if len(args) != 1:
+        parser.print_usage()
+        sys.exit(1)
+    
+    results = measure(os.path.abspath(options.tree),
+                      os.path.abspath(args[0]), options.runs)
+    
+    print "Median of %d runs:" % options.runs
+    print " %-20s: %.2f ms" % ('import videoparser',
+                               median([r[0] for r in results]))
+    print " %-20s: %.2f ms" % ('VideoParser()', median([r[1] for r in results]))
+    print " %-20s: %.2f ms" % ('first parse_file()',
+                               median([r[2] for r in results]))
+    print " %-20s: %.2f ms" % ('total', median([sum(r[:3]) for r in results]))
+    print " %-20s: %d" % ('modules loaded', median([r[3] for r in results]))
@@ -0,0 +1,146 @@
+""" Tests of the ResultCache of videoparser.cache and its use by
+    VideoParser.parse_file(): invalidation, eviction and probes which
+    failed to read the file.
+
+    Usage: ./test_cache.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import corpus
+import videoparser
+import videoparser.cache as cache
+import videoparser.streams as streams
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='videoparser-cache-')
+        self.cache_file = os.path.join(self.directory, 'cache.db')
+        self.filenames = corpus.write_corpus(self.directory)
+        self.create_filestream = streams.factory.create_filestream
+
+        # The parsers print diagnostics
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        streams.factory.create_filestream = self.create_filestream
+        shutil.rmtree(self.directory)
+
+    def tracks(self, parser, filename):
+        video = parser.parse_file(filename)
+        return (len(list(video.video_streams)) +
+                len(list(video.audio_streams)))
+
+    def test_cached(self):
+        parser = videoparser.VideoParser(cache_file=self.cache_file)
+        filename = self.filenames[0]
+        video = parser.parse_file(filename)
+        self.assertEqual(repr(parser.parse_file(filename)), repr(video))
+        self.assertEqual((parser.result_cache.hits,
+                          parser.result_cache.misses), (1, 1))
+        parser.close()
+
+        # The results are written to the database
+        parser = videoparser.VideoParser(cache_file=self.cache_file)
+        self.assertEqual(repr(parser.parse_file(filename)), repr(video))
+        self.assertEqual(parser.result_cache.hits, 1)
+        parser.close()
+
+    def test_changed_file(self):
+        parser = videoparser.VideoParser(cache_file=self.cache_file)
+        filename = os.path.join(self.directory, 'changed.mkv')
+        with open(filename, 'wb') as fh:
+            fh.write(corpus.make_mkv(tracks=2))
+        self.assertEqual(self.tracks(parser, filename), 2)
+        parser.result_cache.flush()
+
+        # A file with another size or modification time is parsed again
+        with open(filename, 'wb') as fh:
+            fh.write(corpus.make_mkv(tracks=4))
+        self.assertEqual(self.tracks(parser, filename), 4)
+        self.assertEqual(parser.result_cache.misses, 2)
+        self.assertEqual(len(parser.result_cache), 1)
+        parser.close()
+
+    def test_invalidate(self):
+        result_cache = cache.ResultCache(self.cache_file)
+        filename = self.filenames[0]
+        filestat = os.stat(filename)
+
+        # Pending and written entries are removed
+        result_cache.store(filename, filestat, None)
+        result_cache.invalidate(filename)
+        self.assertEqual(result_cache.lookup(filestat), (False, None))
+
+        result_cache.store(filename, filestat, None)
+        result_cache.flush()
+        self.assertEqual(result_cache.lookup(filestat), (True, None))
+        result_cache.invalidate(filename)
+        self.assertEqual(result_cache.lookup(filestat), (False, None))
+        self.assertEqual(len(result_cache), 0)
+        result_cache.close()
+
+    def test_eviction(self):
+        result_cache = cache.ResultCache(self.cache_file, max_entries=2)
+        filestats = [os.stat(filename) for filename in self.filenames[:3]]
+        for filename, filestat in zip(self.filenames, filestats[:2]):
+            result_cache.store(filename, filestat, None)
+            time.sleep(0.01)
+        result_cache.flush()
+
+        # The second file is the least recently used when the third is
+        # stored
+        time.sleep(0.01)
+        self.assertEqual(result_cache.lookup(filestats[0]), (True, None))
+        time.sleep(0.01)
+        result_cache.store(self.filenames[2], filestats[2], None)
+        self.assertEqual(len(result_cache), 2)
+        self.assertEqual(result_cache.lookup(filestats[1]), (False, None))
+        self.assertEqual(result_cache.lookup(filestats[0]), (True, None))
+        self.assertEqual(result_cache.lookup(filestats[2]), (True, None))
+        result_cache.close()
+
+    def test_io_error(self):
+        parser = videoparser.VideoParser(cache_file=self.cache_file)
+        filename = self.filenames[0]
+
+        def failing(*args, **kwargs):
+            raise IOError(5, 'Input/output error')
+        streams.factory.create_filestream = failing
+        self.assertEqual(parser.parse_file(filename), None)
+
+        # The failed probe is not cached, the file is parsed the next time
+        self.assertEqual(len(parser.result_cache), 0)
+        streams.factory.create_filestream = self.create_filestream
+        self.assertNotEqual(parser.parse_file(filename), None)
+        self.assertEqual(parser.result_cache.misses, 2)
+        self.assertEqual(len(parser.result_cache), 1)
+        parser.close()
+
+    def test_no_match(self):
+        # A file which no parser can read is cached like any other result
+        parser = videoparser.VideoParser(cache_file=self.cache_file)
+        filename = os.path.join(self.directory, 'junk.avi')
+        with open(filename, 'wb') as fh:
+            fh.write('x' * 5000)
+        self.assertEqual(parser.parse_file(filename), None)
+        self.assertEqual(parser.result_cache.lookup(os.stat(filename)),
+                         (True, None))
+        parser.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+""" Tests of the JSON records of videoparser.cli on the files of corpus.py.
+
+    Usage: ./test_cli.py
+"""
+
+import json
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import corpus
+import videoparser.cli as cli
+
+
+class RecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='videoparser-cli-')
+        self.filenames = corpus.write_corpus(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_cli(self, argv):
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            status = cli.main(argv)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        return status, [json.loads(line) for line in output.splitlines()]
+
+    def test_container(self):
+        status, records = self.run_cli([self.directory])
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(record['path'] for record in records),
+                         sorted(self.filenames))
+
+        # Every corpus format has a container name
+        for record in records:
+            self.assertFalse('error' in record, record)
+            self.assertTrue(record['container'], record['path'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+""" Tests of the Matroska parser on files of corpus.py.
+
+    Usage: ./test_matroska.py
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import corpus
+import videoparser
+import videoparser.streams as streams
+import videoparser.streams.binary as binary
+from videoparser.plugins import matroska
+
+
+class VintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = matroska.Parser()
+
+    def stream(self, data):
+        return streams.factory.create_stringstream(data, streams.endian.big)
+
+    def test_element_id(self):
+        for data, class_id in [('\xEC', 0xEC), ('\x42\x82', 0x4282),
+                               ('\x2A\xD7\xB1', 0x2AD7B1),
+                               ('\x1A\x45\xDF\xA3', 0x1A45DFA3)]:
+            stream = self.stream(data + '\x81')
+            self.assertEqual(self.parser.read_element_id(stream), class_id)
+            self.assertEqual(stream.tell(), len(data))
+
+        # Ids are at most 4 bytes, a zero byte has no length marker at all
+        for data in ['\x08\x00\x00\x00\x01', '\x00']:
+            self.assertRaises(AssertionError, self.parser.read_element_id,
+                              self.stream(data))
+
+    def test_element_size(self):
+        for data, size in [('\x81', 1), ('\x80', 0), ('\xFE', 126),
+                           ('\x40\x7F', 127), ('\x10\x00\x12\x34', 0x1234),
+                           ('\x01\x00\x00\x00\x00\x00\x01\x00', 256),
+                           ('\x01\x00\xFF\xFF\xFF\xFF\xFF\xFF',
+                            0xFFFFFFFFFFFF)]:
+            self.assertEqual(corpus.ebml_size(size, len(data)), data)
+            stream = self.stream(data + '\x81')
+            self.assertEqual(self.parser.read_element_size(stream), size)
+            self.assertEqual(stream.tell(), len(data))
+
+        self.assertRaises(AssertionError, self.parser.read_element_size,
+                          self.stream('\x00\x81'))
+
+    def test_unknown_size(self):
+        # All ones after the length marker is an unknown size, whatever the
+        # length of the vint
+        for length in range(1, 9):
+            data = corpus.be('Q', (1 << (8 * length - length + 1)) - 1)
+            data = data[8 - length:]
+            self.assertEqual(ord(data[0]) >> (8 - length), 1)
+            stream = self.stream(data)
+            self.assertEqual(self.parser.read_element_size(stream), None)
+            self.assertEqual(stream.tell(), length)
+
+    def test_parse_data(self):
+        # The walk from memory gives the elements of the walk from the
+        # stream
+        data = corpus.make_mkv(tracks=4)
+        elements = list(self.parser.parse_data(data))
+        copy_size = binary.copy_size
+        binary.copy_size = 0
+        try:
+            self.assertEqual(list(self.parser.parse_header(self.stream(data))),
+                             elements)
+        finally:
+            binary.copy_size = copy_size
+        self.assertEqual(len([element for element in elements
+                              if element[0] == 'TrackEntry']), 4)
+
+    def test_unknown_size_segment(self):
+        # A live stream has a Segment of unknown size, its children follow
+        # in the same walk
+        tracks = corpus.ebml_element(0x1654AE6B, corpus.ebml_element(
+            0xAE, corpus.ebml_uint(0xD7, 1) + corpus.ebml_uint(0x83, 2)))
+        data = '\x18\x53\x80\x67\xFF' + tracks
+        expected = [('Segment', None, 0), ('Tracks', None, 1),
+                    ('TrackEntry', None, 2), ('TrackNumber', 1, 3),
+                    ('TrackType', 2, 3)]
+        self.assertEqual(list(self.parser.parse_data(data)), expected)
+        self.assertEqual(list(self.parser.parse_header(self.stream(data))),
+                         expected)
+
+        # Only master elements may have an unknown size
+        self.assertRaises(AssertionError, list,
+                          self.parser.parse_data('\xD7\xFF\x01'))
+
+
+class UnknownElementTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = videoparser.VideoParser()
+        self.copy_size = binary.copy_size
+
+    def tearDown(self):
+        binary.copy_size = self.copy_size
+
+    def probe(self, data):
+        # The parser reports the unknown elements on stdout
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            return self.parser.parse_bytes(data, 'sample.mkv')
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    def test_skip_unknown(self):
+        expected = repr(self.probe(corpus.make_mkv(tracks=4)))
+        video = self.probe(corpus.make_mkv(tracks=4, unknown=True))
+        self.assertEqual(repr(video), expected)
+        self.assertEqual(len(list(video.video_streams)), 2)
+        self.assertEqual(len(list(video.audio_streams)), 2)
+
+    def test_skip_unknown_stream(self):
+        # Walk the master elements from the stream instead of from memory
+        binary.copy_size = 0
+        self.test_skip_unknown()
+
+
+if __name__ == "__main__":
+    unittest.main()
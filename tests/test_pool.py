@@ -0,0 +1,63 @@
+""" Tests of videoparser.pool: recovery of parse_many() from worker
+    processes which die while probing.
+
+    Usage: ./test_pool.py
+"""
+
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import corpus
+import videoparser
+import videoparser.pool as pool
+
+
+parse_file = videoparser.VideoParser.parse_file
+
+def crashing_parse_file(self, filename, *args, **kwargs):
+    """ parse_file of the workers, which are forked from this process:
+        kills the worker on the files named crash, like the OOM killer. """
+    if os.path.basename(filename).startswith('crash'):
+        os.kill(os.getpid(), signal.SIGKILL)
+    return parse_file(self, filename, *args, **kwargs)
+
+
+class WorkerCrashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='videoparser-pool-')
+        self.filename = os.path.join(self.directory, 'sample.mkv')
+        self.crash = os.path.join(self.directory, 'crash.mkv')
+        for filename in [self.filename, self.crash]:
+            with open(filename, 'wb') as fh:
+                fh.write(corpus.make_mkv())
+        videoparser.VideoParser.parse_file = crashing_parse_file
+
+    def tearDown(self):
+        videoparser.VideoParser.parse_file = parse_file
+        shutil.rmtree(self.directory)
+
+    def test_crash(self):
+        filenames = [self.filename] * 5 + [self.crash] + [self.filename] * 5
+        results = list(videoparser.VideoParser().parse_many(
+            filenames, workers=2, chunksize=4))
+        self.assertEqual(sorted(filename for filename, result in results),
+                         sorted(filenames))
+
+        # The other files of the chunk of the crash are probed again
+        for filename, result in results:
+            if filename == self.crash:
+                self.assertTrue(isinstance(result, pool.ProbeError))
+            else:
+                self.assertEqual(result.as_dict()['container'], 'matroska')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+""" Tests of videoparser.streams.remote against the RangeServer of
+    rangeserver.py: the number of requests of a probe, the merging of
+    ranges and the fallback for servers which ignore Range headers.
+
+    Usage: ./test_remote.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import corpus
+import rangeserver
+import videoparser
+import videoparser.streams.remote as remote
+
+
+class RemoteTestCase(unittest.TestCase):
+    support_ranges = True
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='videoparser-remote-')
+        self.server = rangeserver.RangeServer(self.directory,
+                                              support_ranges=self.support_ranges)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as fh:
+            fh.write(data)
+        return self.server.url(name)
+
+    def open(self, url, **options):
+        request_size = options.pop('request_size', 65536)
+        merge_gap = options.pop('merge_gap', 65536)
+        return remote.RangeFile(remote.HTTPRangeFetcher(url, **options),
+                                request_size, merge_gap)
+
+
+class RangeRequestTest(RemoteTestCase):
+
+    def test_probe_requests(self):
+        parser = videoparser.VideoParser()
+        for extension, generator in corpus.generators:
+            data = generator()
+            url = self.write('sample.' + extension, data)
+            self.server.reset()
+
+            video = parser.parse_file(url)
+            self.assertEqual(repr(video),
+                             repr(parser.parse_bytes(data,
+                                                     'sample.' + extension)))
+
+            # The headers are in the first request
+            self.assertEqual(self.server.requests, 1)
+
+    def test_merge(self):
+        data = os.urandom(300000)
+        fh = self.open(self.write('data', data))
+        self.assertEqual(fh.requests, 1)
+
+        # Within merge_gap of the first range, the gap is fetched as well
+        fh.seek(100000)
+        self.assertEqual(fh.read(100), data[100000:100100])
+        self.assertEqual(fh.requests, 2)
+        self.assertEqual(len(fh._ranges), 1)
+
+        fh.seek(0)
+        self.assertEqual(fh.read(165536), data[:165536])
+        self.assertEqual(fh.requests, 2)
+
+        # Too far from the cached range
+        fh.seek(290000)
+        self.assertEqual(fh.read(), data[290000:])
+        self.assertEqual(fh.requests, 3)
+        self.assertEqual(len(fh._ranges), 2)
+        self.assertEqual(self.server.requests, 3)
+        fh.close()
+
+    def test_beyond_end(self):
+        fh = self.open(self.write('small', 'x' * 100))
+        self.assertEqual(fh.get_size(), 100)
+        fh.seek(200)
+        self.assertEqual(fh.read(10), '')
+        fh.close()
+
+
+class NoRangeTest(RemoteTestCase):
+    support_ranges = False
+
+    def test_probe(self):
+        parser = videoparser.VideoParser()
+        data = corpus.make_mkv()
+        video = parser.parse_file(self.write('sample.mkv', data))
+        self.assertEqual(repr(video),
+                         repr(parser.parse_bytes(data, 'sample.mkv')))
+
+    def test_partial_body(self):
+        data = os.urandom(8 * 1024 * 1024)
+        fh = self.open(self.write('data', data), max_content=2 * 1024 * 1024)
+        self.assertEqual(fh.get_size(), len(data))
+
+        # Only the start of the body is read
+        fetcher = fh._fetcher
+        self.assertEqual(len(fetcher._content), 65536)
+
+        fh.seek(1000000)
+        self.assertEqual(fh.read(100), data[1000000:1000100])
+        self.assertTrue(len(fetcher._content) < 1200000)
+
+        fh.seek(4 * 1024 * 1024)
+        self.assertRaises(IOError, fh.read, 100)
+        self.assertEqual(self.server.requests, 1)
+        fh.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+""" Tests of videoparser.scanner: the walk with listdir() and lstat(),
+    which skips the lstat() of filtered files in leaf directories.
+
+    Usage: ./test_scanner.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import videoparser.scanner as scanner
+
+
+class ListDirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='videoparser-scanner-')
+        self.files = []
+        for path in ['a.avi', 'a.txt', 'sub/b.avi', 'sub/b.txt',
+                     'sub/c.nfo', 'sub/leaf/d.mkv', 'sub/leaf/d.srt']:
+            path = os.path.join(self.directory, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+            self.files.append(path)
+
+        # Count the lstat() calls of the walk without scandir()
+        self.lstats = []
+        self.scandir = scanner.scandir
+        self.lstat = os.lstat
+        scanner.scandir = None
+        def lstat(path):
+            self.lstats.append(path)
+            return self.lstat(path)
+        os.lstat = lstat
+
+    def tearDown(self):
+        scanner.scandir = self.scandir
+        os.lstat = self.lstat
+        shutil.rmtree(self.directory)
+
+    def walk(self, file_types=None, followlinks=False):
+        return sorted(path for path, filestat in
+                      scanner.walk_files(self.directory, file_types,
+                                         followlinks))
+
+    def test_all_files(self):
+        self.assertEqual(self.walk(), sorted(self.files))
+        self.assertEqual(len(self.lstats), len(self.files) + 2)
+
+    def test_leaf_directory(self):
+        leaf = os.path.join(self.directory, 'sub', 'leaf')
+        if os.stat(leaf).st_nlink != 2:
+            self.skipTest("the file system doesn't count subdirectories")
+
+        self.assertEqual(self.walk(['avi', 'MKV']),
+                         [path for path in sorted(self.files)
+                          if path.endswith('.avi') or path.endswith('.mkv')])
+
+        # The leaf directory has no subdirectories, only its matching file
+        # is lstat()ed. In sub the others are skipped once leaf is found.
+        self.assertTrue(os.path.join(leaf, 'd.mkv') in self.lstats)
+        self.assertFalse(os.path.join(leaf, 'd.srt') in self.lstats)
+        self.assertTrue(len(self.lstats) < len(self.files) + 2)
+
+    def test_followlinks(self):
+        # A symbolic link might point to a directory, every entry is checked
+        self.walk(['avi'], followlinks=True)
+        self.assertEqual(len(self.lstats), len(self.files) + 2)
+
+    def test_no_link_count(self):
+        # File systems which don't count the subdirectories have a link
+        # count of 1 for directories
+        stat = os.stat
+        def stat_nlink(path):
+            result = list(stat(path))
+            result[3] = 1
+            return os.stat_result(result)
+        os.stat = stat_nlink
+        try:
+            self.assertEqual(len(self.walk(['avi'])), 2)
+        finally:
+            os.stat = stat
+        self.assertEqual(len(self.lstats), len(self.files) + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,258 @@
+""" Tests of the streams of videoparser.streams: subsegments of a
+    BinaryStream, the BlockCache and the limits of a ProbeBudget.
+
+    Usage: ./test_streams.py
+"""
+
+import os
+import StringIO
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import corpus
+import videoparser
+import videoparser.streams as streams
+import videoparser.streams.binary as binary
+from videoparser.streams.cache import BlockCache
+
+
+class CountingFile(object):
+    """ File object on a string which counts the seeks and reads. """
+
+    def __init__(self, data):
+        self._fileobj = StringIO.StringIO(data)
+        self.seeks = 0
+        self.reads = 0
+        self.closed = False
+
+    def seek(self, position, whence=0):
+        self.seeks += 1
+        self._fileobj.seek(position, whence)
+
+    def tell(self):
+        return self._fileobj.tell()
+
+    def read(self, length=-1):
+        self.reads += 1
+        return self._fileobj.read(length)
+
+    def close(self):
+        self.closed = True
+
+
+class SubsegmentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = ''.join([chr(i % 251) for i in range(300000)])
+        self.fileobj = CountingFile(self.data)
+        self.stats = streams.IOStats()
+        self.stream = streams.BinaryStream(self.fileobj, len(self.data),
+                                           stats=self.stats)
+
+    def test_view(self):
+        self.stream.seek(1000)
+        view = self.stream.read_subsegment(200000)
+        self.assertEqual(self.stream.tell(), 201000)
+
+        # A view reads nothing until it is parsed
+        self.assertEqual(self.stats.bytes_read, 0)
+        self.assertEqual(view.tell(), 0)
+        self.assertEqual(view.read(10), self.data[1000:1010])
+        self.assertEqual(view.read(10), self.data[1010:1020])
+        self.assertEqual(self.stats.subsegments, 1)
+
+        # The view ends at its length
+        view.seek(199990)
+        self.assertEqual(view.read(100), self.data[200990:201000])
+        self.assertFalse(view.bytes_left())
+        self.assertEqual(view.read(10), '')
+
+        self.assertEqual(self.stream.read(10), self.data[201000:201010])
+
+    def test_shared_cursor(self):
+        view = self.stream.read_subsegment(200000)
+        nested = view.read_subsegment(100000)
+
+        # Sequential reads through the parent, view and nested view only
+        # seek the file object once
+        self.assertEqual(nested.read(100), self.data[:100])
+        self.assertEqual(nested.read(100), self.data[100:200])
+        self.assertEqual(self.fileobj.seeks, 1)
+
+        # The parent read elsewhere, the view has to seek back
+        self.assertEqual(self.stream.read(100), self.data[200000:200100])
+        self.assertEqual(nested.read(100), self.data[200:300])
+        self.assertEqual(self.fileobj.seeks, 3)
+
+    def test_memory(self):
+        self.stream.seek(500)
+        segment = self.stream.read_subsegment(1000)
+        self.assertEqual(self.stream.tell(), 1500)
+
+        # A small subsegment is read at once and parsed from memory
+        self.assertEqual(self.stats.bytes_read, 1000)
+        reads = self.fileobj.reads
+        self.assertEqual(segment.read(10), self.data[500:510])
+        self.assertEqual(segment.read_subsegment(10).read(20),
+                         self.data[510:520])
+        self.assertEqual(segment.tell(), 20)
+        self.assertEqual(self.fileobj.reads, reads)
+        self.assertEqual(self.stats.subsegments, 2)
+
+        segment.seek(995)
+        self.assertEqual(segment.read(10), self.data[1495:1500])
+        self.assertFalse(segment.bytes_left())
+
+    def test_ownership(self):
+        view = self.stream.read_subsegment(binary.copy_size + 1)
+        segment = self.stream.read_subsegment(100)
+
+        # Only the stream which opened the file object closes it
+        view.close()
+        segment.close()
+        self.assertFalse(self.fileobj.closed)
+        self.assertEqual(self.stream.read(10),
+                         self.data[binary.copy_size + 101:
+                                   binary.copy_size + 111])
+
+        self.stream.close()
+        self.assertTrue(self.fileobj.closed)
+
+    def test_not_owner(self):
+        stream = streams.BinaryStream(self.fileobj, len(self.data),
+                                      owner=False)
+        stream.close()
+        self.assertFalse(self.fileobj.closed)
+
+
+class BlockCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = ''.join([chr(i % 251) for i in range(1000)])
+        self.fileobj = CountingFile(self.data)
+        self.cache = BlockCache(self.fileobj, block_size=100, max_blocks=2)
+
+    def read(self, position, length):
+        self.cache.seek(position)
+        data = self.cache.read(length)
+        self.assertEqual(data, self.data[position:position + length])
+
+    def test_hits(self):
+        self.read(10, 10)
+        self.read(30, 10)
+        self.read(20, 5)
+        self.assertEqual(self.fileobj.reads, 1)
+        self.assertEqual(self.cache.cache_info(), (2, 1, 2, 1, 100))
+
+        # Across the end of a block
+        self.read(90, 20)
+        self.assertEqual(self.fileobj.reads, 2)
+        self.assertEqual(self.cache.cache_info(), (3, 2, 2, 2, 100))
+
+    def test_lru(self):
+        self.read(0, 10)
+        self.read(100, 10)
+        self.read(0, 10)
+
+        # Block 1 is the least recently used and is evicted for block 2
+        self.read(200, 10)
+        self.read(0, 10)
+        self.assertEqual(self.cache.misses, 3)
+        self.read(100, 10)
+        self.assertEqual(self.cache.misses, 4)
+        self.assertEqual(self.cache.cache_info().blocks, 2)
+
+    def test_large_read(self):
+        # Reads larger than a block bypass the cache
+        self.read(50, 300)
+        self.assertEqual(self.cache.cache_info(), (0, 1, 2, 0, 100))
+
+        self.cache.seek(-10, 2)
+        self.assertEqual(self.cache.read(), self.data[-10:])
+
+    def test_stats(self):
+        stats = streams.IOStats()
+        cache = BlockCache(self.fileobj, block_size=100, max_blocks=2,
+                           stats=stats)
+        stream = streams.BinaryStream(cache, len(self.data), stats=stats)
+        stream.read(10)
+        stream.read(10)
+        stream.seek(500)
+        stream.read(10)
+
+        # The statistics are added to the IOStats when the cache is closed
+        self.assertEqual(stats.cache_misses, 0)
+        stream.close()
+        self.assertTrue(self.fileobj.closed)
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (1, 2))
+        self.assertEqual(stats.reads, 3)
+
+
+class ProbeBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = 'x' * 100000
+
+    def stream(self, budget):
+        return streams.BinaryStream(StringIO.StringIO(self.data),
+                                    len(self.data), budget=budget)
+
+    def test_max_read(self):
+        stream = self.stream(streams.ProbeBudget(max_read=100))
+        stream.read(100)
+        self.assertRaises(streams.ProbeLimit, stream.read, 101)
+
+        # Also for the read of a small subsegment
+        self.assertRaises(streams.ProbeLimit, stream.read_subsegment, 1000)
+
+    def test_max_bytes(self):
+        stream = self.stream(streams.ProbeBudget(max_bytes=80000))
+        stream.read(10000)
+
+        # The budget is shared with the subsegments
+        view = stream.read_subsegment(70000)
+        view.read(60000)
+        segment = stream.read_subsegment(5000)
+        self.assertEqual(len(segment.read(5000)), 5000)
+        self.assertRaises(streams.ProbeLimit, view.read, 10000)
+
+    def test_mapped(self):
+        stream = streams.factory.create_stringstream(
+            self.data, streams.endian.little,
+            budget=streams.ProbeBudget(max_bytes=1000))
+        stream.read(1000)
+        self.assertRaises(streams.ProbeLimit, stream.read, 1)
+
+    def test_timeout(self):
+        stream = self.stream(streams.ProbeBudget(timeout=0.01))
+        segment = stream.read_subsegment(1000)
+        segment.read(10)
+        time.sleep(0.02)
+
+        # Reads from memory check the time limit as well, a parser looping
+        # over the same data would never stop otherwise
+        segment.seek(0)
+        self.assertRaises(streams.ProbeLimit, segment.read, 10)
+        self.assertRaises(streams.ProbeLimit, stream.read, 10)
+
+    def test_parse_file(self):
+        handle, filename = tempfile.mkstemp(suffix='.mkv')
+        with os.fdopen(handle, 'wb') as fh:
+            fh.write(corpus.make_mkv(tracks=64))
+        try:
+            parser = videoparser.VideoParser(max_probe_bytes=1000)
+            self.assertRaises(streams.ProbeLimit, parser.parse_file,
+                              filename)
+            parser = videoparser.VideoParser(max_probe_bytes=100000)
+            self.assertNotEqual(parser.parse_file(filename), None)
+        finally:
+            os.remove(filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,22 +26,41 @@
 # Python built-in modules
 import sys
 import os
+import time
 
-# Project modules
+# Project modules, the pool, scanner and cache modules are imported when
+# they are first used
 import videofile
 import streams
+import timing
+import plugins
 
 __all__ = ['VideoParser']
 __author__ = "Michael van Tellingen <michaelvantellingen at gmail.com>"
 
 from videoparser.version import version as __version__
 
-# List of plugins
-parser_plugins = ['asf', 'matroska', 'avi', 'realmedia', 'quicktime']
+# List of plugins with the file types and signatures of their parser, the
+# plugin modules are only imported when a file is parsed with them
+parser_plugins = plugins.parser_plugins
+
+def _chain(*callbacks):
+    """ Return a callback which calls each of the callbacks which are not
+        None, or None when all of them are. """
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if len(callbacks) < 2:
+        return callbacks and callbacks[0] or None
+    
+    def chained(*args):
+        for callback in callbacks:
+            callback(*args)
+    return chained
 
 class VideoParser(object):
-    """ The VideoParser object will first guess the required parser based on
-        the file extension. If that fails it will try each available parser.
+    """ The VideoParser object will select the required parser based on the
+        signature at the start of the file. For unknown signatures it will
+        guess the parser based on the file extension, and if that fails it
+        will try each available parser.
         
         On success it will return the videofile.VideoFile object
     
@@ -51,75 +70,449 @@ class VideoParser(object):
             
             for video_stream in video.video_streams:
                 print video_stream.resolution
-                print video_stream.codec"""
+                print video_stream.codec
+        
+        Files can also be parsed in the background with parse_file_async(),
+        at most max_concurrent probes run at the same time. Large batches
+        of files can be parsed by worker processes with parse_many(), or by
+        worker threads with parse_many_threaded() when the probes wait on
+        slow storage rather than the cpu. scan() parses the files in a
+        directory tree while walking it. Videos in memory or in file objects
+        are parsed with parse_bytes() and parse_fileobj().
+        
+        When io_stats is set the I/O of each probe is counted in a
+        streams.IOStats object, available as the io_stats attribute of the
+        returned VideoFile. The io_stats_callback is called with the
+        filename and the IOStats object after each probe, including failed
+        probes.
+        
+        Each file is opened once, the stream is passed to every parser that
+        is tried and closed when the probe is done. The stream_options are
+        passed to streams.factory.create_filestream().
+        
+        When cache_file is given the results are kept in a cache.ResultCache
+        database of at most cache_size files, parse_file() only parses the
+        files which are not in the cache or changed since. Call close() to
+        write the pending changes of the cache. With memory_cache_size the
+        results of that many recently parsed files are also kept in a
+        cache.MemoryCache, for at most memory_cache_ttl seconds when set.
+        Files are stat()ed on every lookup to detect changes.
+        
+        When neither the signature nor the extension selects a parser, the
+        parsers are tried in the order of the number of files they parsed,
+        which are counted per plugin name in parser_counts. The counts can
+        be seeded with a dict or the filename of a JSON file written by
+        save_parser_counts().
+        
+        Each probe can be limited to max_probe_bytes bytes read in total,
+        reads of at most max_read_size bytes and probe_timeout seconds. A
+        probe which exceeds a limit raises streams.ProbeLimit instead of
+        returning None.
+        
+        When timing_callback is set the phases of each probe are timed, it
+        is called with the filename, phase, plugin name, duration in seconds
+        and success flag of every phase, see timing.PhaseTimer.
+        
+        When metrics is a metrics.ProbeMetrics object the probes, failures,
+        durations, bytes read and queue depths of the pools are recorded in
+        it. Its registry can be served or written in the Prometheus text
+        format."""
 
-    def __init__(self):
+    def __init__(self, max_concurrent=4, io_stats=False,
+                 io_stats_callback=None, stream_options=None,
+                 cache_file=None, cache_size=1000000, memory_cache_size=0,
+                 memory_cache_ttl=None, parser_counts=None,
+                 max_probe_bytes=None, max_read_size=None, probe_timeout=None,
+                 timing_callback=None, metrics=None):
         """ Initialise the VideoParser object."""
         self.parsers = []
+        self.max_concurrent = max_concurrent
+        self.stream_options = stream_options or {}
+        self.metrics = metrics
+        if metrics is not None:
+            io_stats_callback = _chain(io_stats_callback,
+                                       metrics.io_stats_callback)
+            timing_callback = _chain(timing_callback,
+                                     metrics.timing_callback)
+        self.io_stats = io_stats or io_stats_callback is not None
+        self.io_stats_callback = io_stats_callback
+        self.cache_file = cache_file
+        self.cache_size = cache_size
+        self.result_cache = None
+        if cache_file is not None:
+            import videoparser.cache as cache
+            self.result_cache = cache.ResultCache(cache_file, cache_size)
+        self.memory_cache_size = memory_cache_size
+        self.memory_cache_ttl = memory_cache_ttl
+        self.memory_cache = None
+        if memory_cache_size:
+            import videoparser.cache as cache
+            self.memory_cache = cache.MemoryCache(memory_cache_size,
+                                                  memory_cache_ttl)
+        self.max_probe_bytes = max_probe_bytes
+        self.max_read_size = max_read_size
+        self.probe_timeout = probe_timeout
+        self.timing_callback = timing_callback
+        self._pool = None
         self._import_parsers()
+        
+        self.parser_counts = {}
+        if isinstance(parser_counts, basestring):
+            import json
+            with open(parser_counts) as fh:
+                parser_counts = json.load(fh)
+        if parser_counts:
+            self.parser_counts.update(parser_counts)
     
     def _import_parsers(self):
-        """ Import the specified parsers in the global list parser_plugins. """
-        # Import the parsers
-        for plugin_filename in parser_plugins:
-            try:
-                module = __import__("videoparser.plugins." + plugin_filename,
-                                    None, None, "plugins")
-            except ImportError, err:
-                raise
-                print "Unable to open parser module '%s'" % plugin_filename 
-                continue
-        
-            # Create parser object
-            try:
-                parser = module.Parser()
-            except AttributeError, err:
-                print "Invalid parser plugin: %s" % err
-                continue
-            
-            self.parsers.append(parser)
-
+        """ Register the parsers in the global list parser_plugins, the
+            plugin modules are imported when they are first used. """
+        for name, file_types, signatures in parser_plugins:
+            self.parsers.append(plugins.LazyParser(name, file_types,
+                                                   signatures))
+        
+        # Number of bytes to read to match the signatures of all parsers
+        self._sniff_size = max([offset + len(magic)
+                                for parser in self.parsers
+                                for signature in parser._signatures
+                                for offset, magic in signature] or [0])
     
-    def parse_file(self, filename):
+    def parse_file(self, filename, filestat=None, signature_only=False):
         """ Parse the given file and return a videofile.VideoFile object on
             success or None when there was a parsing error or no matching
-            parser was found. """
+            parser was found.
+            
+            filestat is the os.stat() result of the file when the caller
+            already has it. With signature_only the file is not parsed when
+            its signature is unknown."""
+            
+        video = self._new_videofile()
+        timer = self._new_timer(filename)
+        result = None
+        try:
+            if ((self.result_cache is None and self.memory_cache is None) or
+                streams.factory.is_url(filename)):
+                result = self._parse_file(filename, video, filestat,
+                                          signature_only, timer)
+            else:
+                result = self._parse_file_cached(filename, video, filestat,
+                                                 signature_only, timer)
+            return result
+        finally:
+            if timer is not None:
+                timer.record('probe', timer.start, result is not None)
+            if self.io_stats_callback is not None:
+                self.io_stats_callback(filename, video.io_stats)
+    
+    def parse_bytes(self, data, filename=None):
+        """ Parse a video in memory, data is a string or an object with the
+            buffer interface such as a bytearray, mmap or memoryview. It can
+            be the start of the file only, as long as the headers are in it.
+            The filename is only used to guess the parser on the extension.
             
+            Returns a videofile.VideoFile object or None like parse_file().
+            """
+        video = self._new_videofile()
+        timer = self._new_timer(filename)
+        try:
+            with timing.span(timer, 'open'):
+                stream = streams.factory.create_stringstream(
+                    data, streams.endian.little, stats=video.io_stats,
+                    budget=self._new_budget())
+        except IOError:
+            print "IOError on file '%s'"  % filename
+            return None
+        
+        return self._parse_opened_stream(filename, stream, video, timer)
+    
+    def parse_fileobj(self, fileobj, filename=None):
+        """ Parse a video from a seekable file object, for example an upload
+            which was not written to disk. The file object is read from the
+            beginning and not closed. The filename, by default the name
+            attribute of the file object, is only used to guess the parser
+            on the extension.
+            
+            Returns a videofile.VideoFile object or None like parse_file().
+            """
+        if filename is None:
+            filename = getattr(fileobj, 'name', None)
+        
+        video = self._new_videofile()
+        timer = self._new_timer(filename)
+        try:
+            with timing.span(timer, 'open'):
+                stream = streams.factory.create_fileobjstream(
+                    fileobj, streams.endian.little, stats=video.io_stats,
+                    budget=self._new_budget())
+        except IOError:
+            print "IOError on file '%s'"  % filename
+            return None
+        
+        return self._parse_opened_stream(filename, stream, video, timer)
+    
+    def _new_videofile(self):
         video = videofile.VideoFile()
+        if self.io_stats:
+            video.io_stats = streams.IOStats()
+        return video
+    
+    def _new_budget(self):
+        """ Return the streams.ProbeBudget for a probe, or None without
+            limits. """
+        if (self.max_probe_bytes is None and self.max_read_size is None and
+            self.probe_timeout is None):
+            return None
+        return streams.ProbeBudget(self.max_probe_bytes, self.max_read_size,
+                                   self.probe_timeout)
+    
+    def _new_timer(self, filename):
+        """ Return the timing.PhaseTimer for a probe, or None when probes
+            are not timed. """
+        if self.timing_callback is None:
+            return None
+        return timing.PhaseTimer(self.timing_callback, filename)
+    
+    def _parse_opened_stream(self, filename, stream, video, timer=None):
+        result = None
+        try:
+            with stream:
+                stream.timer = timer
+                result = self._parse_stream(filename or '', stream, video)
+                return result
+        finally:
+            if timer is not None:
+                timer.record('probe', timer.start, result is not None)
+            if self.io_stats_callback is not None:
+                self.io_stats_callback(filename, video.io_stats)
+    
+    def _parse_file_cached(self, filename, video, filestat, signature_only,
+                           timer=None):
+        if filestat is None:
+            filestat = os.stat(filename)
         
-
-        filetype = filename[filename.rindex(os.extsep)+1:]
-        # Guess on the extension which parser to use
-        for parser in self.parsers:
-            if filetype in parser._file_types:
-                break
-            parser = None
-        
-        guessed_parser = parser
-        if guessed_parser and self._parse_file_with(filename, parser, video):
-            return video
-        
-        # Don't try other parsers
-        #return None
-    
-        # Try all parsers then
-        for parser in self.parsers:
+        found = False
+        if self.memory_cache is not None:
+            found, result = self.memory_cache.lookup(filename, filestat)
+        
+        if not found and self.result_cache is not None:
+            found, result = self.result_cache.lookup(filestat)
+            if found and self.memory_cache is not None:
+                self.memory_cache.store(filename, filestat, result)
+        
+        if found:
+            if result is not None:
+                result.io_stats = video.io_stats
+            return result
+        
+        result = self._parse_file(filename, video, filestat, signature_only,
+                                  timer)
+        
+        # Without signature_only the file might still be parsed on its
+        # extension, and the file might be readable the next time
+        if result is not None or not (signature_only or video._io_error):
+            if self.memory_cache is not None:
+                self.memory_cache.store(filename, filestat, result)
+            if self.result_cache is not None:
+                self.result_cache.store(filename, filestat, result)
+        return result
+    
+    def _parse_file(self, filename, video, filestat=None,
+                    signature_only=False, timer=None):
+        try:
+            with timing.span(timer, 'open'):
+                stream = streams.factory.create_filestream(
+                    filename, streams.endian.little, stats=video.io_stats,
+                    filestat=filestat, budget=self._new_budget(),
+                    **self.stream_options)
+        except IOError:
+            print "IOError on file '%s'"  % filename
+            video._io_error = True
+            return None
+        
+        with stream:
+            stream.timer = timer
+            return self._parse_stream(filename, stream, video, signature_only)
+    
+    def _parse_stream(self, filename, stream, video, signature_only=False):
+        # Select the parser on the signature at the start of the file
+        with timing.span(stream.timer, 'sniff'):
+            header = stream.read(self._sniff_size)
+            candidates = [parser for parser in self.parsers
+                          if parser.match_signature(header)]
+        
+        # Unknown signature, first try the parser guessed on the
+        # extension and then all other parsers, the parsers which
+        # parsed the most files first
+        if not candidates and not signature_only:
+            filetype = os.path.splitext(filename)[1][1:]
+            candidates = [parser for parser in self.parsers
+                          if filetype in parser._file_types][:1]
+            counts = self.parser_counts
+            candidates += sorted([parser for parser in self.parsers
+                                  if parser not in candidates],
+                                 key=lambda parser:
+                                     -counts.get(parser.name, 0))
+        
+        for parser in candidates:
+            if self._parse_file_with(filename, stream, parser, video):
+                # Not locked, a count lost by concurrent probes only
+                # affects the order
+                self.parser_counts[parser.name] = (
+                    self.parser_counts.get(parser.name, 0) + 1)
+                return video
+        
+        return None
+    
+    def parse_file_async(self, filename, callback=None):
+        """ Parse the given file in a worker thread and return a
+            pool.ProbeFuture for the result of parse_file(). The callback
+            is called with the future when the parsing finished."""
+        if self._pool is None:
+            import videoparser.pool as pool
+            self._pool = pool.ProbePool(lambda: self, self.max_concurrent,
+                                        depth_callback=self._depth_callback(
+                                            'async'))
+        
+        future = self._pool.submit(filename)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+    
+    def parse_many(self, filenames, workers=None, chunksize=16):
+        """ Parse the filenames in a pool of worker processes (by default
+            one per cpu) and yield (filename, result) tuples as the probes
+            finish. The result is the videofile.VideoFile object, None when
+            no parser matched, a streams.ProbeLimit when the probe exceeded
+            a limit or a pool.ProbeError when parsing failed otherwise.
             
-            # Don't parse the file twice with the same parser
-            if parser == guessed_parser:
-                continue
+            Each worker has its own VideoParser with the same options. The
+            io_stats_callback and timing_callback (and so the metrics) are
+            called in this process for the probes of the workers, just
+            before their result is yielded."""
+        import videoparser.pool as pool
+        return pool.probe_processes(filenames, self._worker_options(),
+                                    workers, chunksize,
+                                    depth_callback=self._depth_callback(
+                                        'processes'),
+                                    timing_callback=self.timing_callback,
+                                    io_stats_callback=self.io_stats_callback)
+    
+    def parse_many_threaded(self, filenames, workers=None, max_pending=None,
+                            by_directory=False):
+        """ Parse the filenames in worker threads (by default max_concurrent)
+            and yield (filename, result) tuples as the probes finish. The
+            result is the videofile.VideoFile object, None when no parser
+            matched or the exception raised while parsing.
             
-            if self._parse_file_with(filename, parser, video):
-                return video
+            At most max_pending files are probed or queued at the same time.
+            With by_directory the files of a directory are parsed one after
+            another and yielded in the given order, see pool.probe_threads().
+            """
+        import videoparser.pool as pool
+        return pool.probe_threads(filenames, self.parse_file,
+                                  workers or self.max_concurrent,
+                                  max_pending, by_directory,
+                                  self._depth_callback('threads'))
     
-        return None
+    def scan(self, top, file_types=None, by_signature=False, workers=None,
+             max_pending=None, by_directory=False, followlinks=False):
+        """ Walk the directory tree below top and parse the files in worker
+            threads like parse_many_threaded(), yielding (filename, result)
+            tuples as the probes finish. The tree is walked while the results
+            are consumed, so the memory use doesn't depend on its size.
+            
+            By default the files with the extensions of the parsers are
+            parsed, file_types is a list of other extensions to parse. With
+            by_signature the files are selected on their signature instead
+            (unless file_types is given as well), files which no parser can
+            read are then skipped."""
+        import functools
+        import videoparser.pool as pool
+        import videoparser.scanner as scanner
+        
+        if file_types is None and not by_signature:
+            file_types = [file_type for parser in self.parsers
+                          for file_type in parser._file_types]
+        
+        probe = self.parse_file
+        if by_signature:
+            probe = functools.partial(self.parse_file, signature_only=True)
+        
+        results = pool.probe_threads(
+            scanner.walk_files(top, file_types, followlinks), probe,
+            workers or self.max_concurrent, max_pending, by_directory,
+            self._depth_callback('threads'))
+        
+        if by_signature:
+            results = ((filename, result) for filename, result in results
+                       if result is not None)
+        return results
+    
+    def save_parser_counts(self, filename):
+        """ Write the parser_counts to a JSON file, which can seed the
+            counts of another VideoParser. """
+        import json
+        with open(filename, 'w') as fh:
+            json.dump(self.parser_counts, fh, indent=4, sort_keys=True)
     
-    def _parse_file_with(self, filename, parser, video):
+    def _depth_callback(self, pool):
+        """ Return the callback which records the queue depth of pool in
+            the metrics, or None without metrics. """
+        if self.metrics is None:
+            return None
+        return self.metrics.queue_depth_callback(pool)
+    
+    def _worker_options(self):
+        """ Options to create a VideoParser in a worker process. """
+        return {'io_stats': self.io_stats,
+                'stream_options': self.stream_options,
+                'cache_file': self.cache_file,
+                'cache_size': self.cache_size,
+                'memory_cache_size': self.memory_cache_size,
+                'memory_cache_ttl': self.memory_cache_ttl,
+                'parser_counts': dict(self.parser_counts),
+                'max_probe_bytes': self.max_probe_bytes,
+                'max_read_size': self.max_read_size,
+                'probe_timeout': self.probe_timeout}
+    
+    def close(self):
+        """ Stop the worker threads used by parse_file_async() and close the
+            result cache. """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        
+        if self.result_cache is not None:
+            self.result_cache.close()
+            self.result_cache = None
+    
+    def _parse_file_with(self, filename, stream, parser, video):
+        timer = stream.timer
+        if timer is None:
+            return self._try_parser(filename, stream, parser, video)
+        
+        # Time the attempt, the phases timed by the plugin are passed with
+        # its name
+        timer.plugin = parser.name
+        start = time.time()
+        success = False
+        try:
+            success = self._try_parser(filename, stream, parser, video)
+            return success
+        finally:
+            timer.record('parse', start, bool(success))
+            timer.plugin = None
+    
+    def _try_parser(self, filename, stream, parser, video):
+        
+        # Every parser starts at the beginning of the file
+        stream.seek(0)
+        stream.set_endianess(parser._endianess)
             
         # Check if this is the right parser for the file
         try:
             #print "Trying to parse %s with %s" % (filename, parser)
-            if parser.parse(filename, video):
+            if parser.parse(stream, video):
                 return True
             
             print "failed..."
@@ -128,7 +521,10 @@ class VideoParser(object):
             return False
         except IOError:
             print "IOError on file '%s'"  % filename
+            video._io_error = True
             return False
+        except streams.ProbeLimit:
+            raise
         except:
             print "Error parsing '%s'" % filename
             raise
@@ -0,0 +1,298 @@
+""" Caches of parse results. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+import copy
+import cPickle
+import os
+import threading
+import time
+
+from videoparser.version import version
+
+
+# Statistics returned by MemoryCache.cache_info()
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses',
+                                                 'max_entries', 'entries',
+                                                 'ttl'])
+
+
+def _dump(video):
+    """ Serialize the result of a parse, a VideoFile object or None. """
+    if video is not None and video.io_stats is not None:
+        # The I/O of this probe says nothing about later lookups
+        video = copy.copy(video)
+        video.io_stats = None
+    return cPickle.dumps(video, cPickle.HIGHEST_PROTOCOL)
+
+
+class ResultCache(object):
+    """ Cache of the results of VideoParser.parse_file() in a SQLite
+        database, keyed by the device, inode, size and modification time of
+        the files.
+        
+        The entry of a file which changed is replaced when the file is
+        parsed again, the cache is cleared when it was written by another
+        version of videoparser. When the cache holds more than max_entries
+        files the least recently used entries are removed.
+        
+        Changes are kept in memory and written in one short transaction
+        every commit_interval changes and by flush() and close(), the number
+        of entries is checked when writing. The database is in WAL mode and
+        not locked between the writes, so it can be shared by threads and
+        processes (like the workers of VideoParser.parse_many())."""
+    
+    def __init__(self, filename, max_entries=1000000, commit_interval=1000):
+        # Imported here since the cache is optional
+        import sqlite3
+        
+        self.filename = filename
+        self.max_entries = max_entries
+        self.commit_interval = commit_interval
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._changes = 0
+        
+        # Rows stored and used times of lookups not yet written, by
+        # (device, inode)
+        self._pending = {}
+        self._touched = {}
+        
+        # Transactions are started explicitly, sqlite3 would otherwise keep
+        # the write lock until the next commit
+        self._db = sqlite3.connect(filename, timeout=60,
+                                   check_same_thread=False,
+                                   isolation_level=None)
+        self._db.text_factory = str
+        
+        # Readers don't wait for the writer of another process
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+    
+    def _create_tables(self):
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("CREATE TABLE IF NOT EXISTS meta ("
+                   "key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS results ("
+                   "device INTEGER, inode INTEGER, size INTEGER, "
+                   "mtime REAL, path TEXT, used REAL, data BLOB, "
+                   "PRIMARY KEY (device, inode))")
+        db.execute("CREATE INDEX IF NOT EXISTS results_used "
+                   "ON results (used)")
+        db.execute("CREATE INDEX IF NOT EXISTS results_path "
+                   "ON results (path)")
+        
+        # The results of another version of the parsers may differ
+        row = db.execute("SELECT value FROM meta WHERE key = 'version'"
+                         ).fetchone()
+        if row is None or row[0] != version:
+            db.execute("DELETE FROM results")
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                       (version,))
+        db.execute("COMMIT")
+    
+    def lookup(self, filestat):
+        """ Return a (found, video) tuple for the file with the os.stat()
+            result filestat, video is the cached VideoFile object or None
+            when no parser could read the file. """
+        key = (filestat.st_dev, filestat.st_ino)
+        with self._lock:
+            row = self._pending.get(key)
+            if row is not None:
+                row = (row[2], row[3], row[6])
+            else:
+                row = self._db.execute("SELECT size, mtime, data "
+                                       "FROM results "
+                                       "WHERE device = ? AND inode = ?",
+                                       key).fetchone()
+            if (row is None or row[0] != filestat.st_size or
+                row[1] != filestat.st_mtime):
+                self.misses += 1
+                return False, None
+            
+            self.hits += 1
+            self._touched[key] = time.time()
+            self._changed()
+        
+        return True, cPickle.loads(str(row[2]))
+    
+    def store(self, filename, filestat, video):
+        """ Store the result of parsing filename, a VideoFile object or
+            None. """
+        data = _dump(video)
+        
+        key = (filestat.st_dev, filestat.st_ino)
+        
+        with self._lock:
+            self._pending[key] = key + (filestat.st_size, filestat.st_mtime,
+                                        os.path.abspath(filename),
+                                        time.time(), buffer(data))
+            self._touched.pop(key, None)
+            self._changed()
+    
+    def invalidate(self, filename):
+        """ Remove the entry of filename. """
+        path = os.path.abspath(filename)
+        with self._lock:
+            for key, row in self._pending.items():
+                if row[4] == path:
+                    del self._pending[key]
+            self._commit(("DELETE FROM results WHERE path = ?", (path,)))
+    
+    def clear(self):
+        """ Remove all entries. """
+        with self._lock:
+            self._pending.clear()
+            self._touched.clear()
+            self._commit(("DELETE FROM results", ()))
+    
+    def flush(self):
+        """ Commit the pending changes. """
+        with self._lock:
+            self._commit()
+    
+    def close(self):
+        """ Commit the pending changes and close the database. """
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+                self._db.close()
+                self._db = None
+    
+    def __len__(self):
+        with self._lock:
+            self._commit()
+            return self._db.execute("SELECT COUNT(*) FROM results"
+                                    ).fetchone()[0]
+    
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= self.commit_interval:
+            self._commit()
+    
+    def _commit(self, *statements):
+        """ Write the pending changes and execute the (statement,
+            parameters) tuples in one transaction. """
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if self._pending:
+                db.executemany("INSERT OR REPLACE INTO results "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               self._pending.values())
+            if self._touched:
+                db.executemany("UPDATE results SET used = ? "
+                               "WHERE device = ? AND inode = ?",
+                               [(used,) + key for key, used
+                                in self._touched.items()])
+            for statement, parameters in statements:
+                db.execute(statement, parameters)
+            
+            count = db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                db.execute("DELETE FROM results WHERE rowid IN ("
+                           "SELECT rowid FROM results ORDER BY used "
+                           "LIMIT ?)", (count - self.max_entries,))
+            db.execute("COMMIT")
+        except:
+            db.execute("ROLLBACK")
+            raise
+        
+        self._pending.clear()
+        self._touched.clear()
+        self._changes = 0
+
+
+class MemoryCache(object):
+    """ Cache of the results of VideoParser.parse_file() in memory, which
+        keeps the max_entries most recently used files.
+        
+        An entry is only used while the device, inode, size and modification
+        time of the file are unchanged and, when ttl is set, for at most ttl
+        seconds. The results are stored serialized and every lookup returns
+        a new copy, so callers can't change the cached results. The cache
+        can be shared by threads."""
+    
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+    
+    def lookup(self, filename, filestat):
+        """ Return a (found, video) tuple for filename with the os.stat()
+            result filestat, video is a copy of the cached VideoFile object
+            or None when no parser could read the file. """
+        key = (filestat.st_dev, filestat.st_ino, filestat.st_size,
+               filestat.st_mtime)
+        with self._lock:
+            entry = self._entries.pop(filename, None)
+            if entry is None or entry[0] != key or (
+                self.ttl is not None and time.time() - entry[1] > self.ttl):
+                self.misses += 1
+                return False, None
+            
+            self.hits += 1
+            self._entries[filename] = entry
+        
+        return True, cPickle.loads(entry[2])
+    
+    def store(self, filename, filestat, video):
+        """ Store the result of parsing filename, a VideoFile object or
+            None. """
+        key = (filestat.st_dev, filestat.st_ino, filestat.st_size,
+               filestat.st_mtime)
+        entry = (key, time.time(), _dump(video))
+        
+        with self._lock:
+            self._entries.pop(filename, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+            self._entries[filename] = entry
+    
+    def invalidate(self, filename):
+        """ Remove the entry of filename. """
+        with self._lock:
+            self._entries.pop(filename, None)
+    
+    def clear(self):
+        """ Remove all entries. """
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def cache_info(self):
+        """ Return the hit and miss statistics of the cache. """
+        return CacheInfo(self.hits, self.misses, self.max_entries,
+                         len(self._entries), self.ttl)
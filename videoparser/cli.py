@@ -0,0 +1,234 @@
+""" Command line prober, writes the results as JSON Lines. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import errno
+import json
+import optparse
+import os
+import sys
+import time
+
+import videoparser
+import videoparser.metrics as metrics
+import videoparser.pool as pool
+import videoparser.scanner as scanner
+
+
+usage = """%prog [options] [path ...]
+
+Probe video files and write one JSON object per file to stdout. Directories
+are walked recursively. Without paths, or with the path -, the paths are
+read from stdin, one per line."""
+
+
+def create_option_parser():
+    parser = optparse.OptionParser(usage=usage,
+                                   version=videoparser.__version__)
+    parser.add_option('-j', '--workers', type='int', default=4,
+                      help="number of files probed at the same time "
+                           "[default: %default]")
+    parser.add_option('-0', '--null', action='store_true',
+                      help="paths on stdin are separated by NUL characters, "
+                           "like the output of find -print0")
+    parser.add_option('-s', '--signature', action='store_true',
+                      help="select the files in directories on their "
+                           "signature instead of their extension")
+    parser.add_option('-d', '--by-directory', action='store_true',
+                      help="probe the files of a directory one after "
+                           "another and write them in the given order")
+    parser.add_option('--io-stats', action='store_true',
+                      help="include the I/O statistics of each probe")
+    parser.add_option('--cache', metavar='FILE',
+                      help="keep the results in a cache database")
+    parser.add_option('--timeout', type='float', metavar='SECONDS',
+                      help="time limit of a probe")
+    parser.add_option('--max-bytes', type='int', metavar='BYTES',
+                      help="limit on the bytes read by a probe")
+    parser.add_option('--max-read', type='int', metavar='BYTES',
+                      help="limit on the size of a single read")
+    parser.add_option('--metrics-port', type='int', metavar='PORT',
+                      help="serve Prometheus metrics of the probes on "
+                           "http://127.0.0.1:PORT/metrics")
+    parser.add_option('--metrics-file', metavar='FILE',
+                      help="write Prometheus metrics of the probes to FILE")
+    parser.add_option('--metrics-interval', type='float', default=10,
+                      metavar='SECONDS',
+                      help="time between the writes of the metrics file "
+                           "[default: %default]")
+    return parser
+
+
+def read_paths(fileobj, separator):
+    """ Yield the paths in fileobj, which are separated by separator. """
+    if separator == '\n':
+        for line in fileobj:
+            path = line.rstrip('\r\n')
+            if path:
+                yield path
+        return
+    
+    rest = ''
+    while True:
+        data = fileobj.read(65536)
+        if not data:
+            break
+        paths = (rest + data).split(separator)
+        rest = paths.pop()
+        for path in paths:
+            if path:
+                yield path
+    if rest:
+        yield rest
+
+
+def expand_paths(paths, file_types):
+    """ Yield (path, filestat) for the files and the files in the
+        directories of paths. """
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in scanner.walk_files(path, file_types):
+                yield entry
+        else:
+            yield path, None
+
+
+def probe(video_parser, filename, filestat, signature_only):
+    """ Parse filename, returns the result and the duration of the probe.
+        Errors are returned as result. With signature_only None is returned
+        for files which no parser can read. """
+    start = time.time()
+    try:
+        result = video_parser.parse_file(filename, filestat, signature_only)
+    except Exception, err:
+        result = err
+    
+    if result is None and signature_only:
+        return None
+    return result, time.time() - start
+
+
+def format_result(filename, result, elapsed, io_stats):
+    """ Return the JSON object of the result of a probe. """
+    encoding = sys.getfilesystemencoding() or 'utf-8'
+    record = {'path': filename.decode(encoding, 'replace'),
+              'time': round(elapsed, 6)}
+    
+    if isinstance(result, Exception):
+        record['error'] = "%s: %s" % (result.__class__.__name__, result)
+    elif result is None:
+        record['error'] = "No parser could read the file"
+    else:
+        record.update(result.as_dict())
+        if io_stats:
+            record['io_stats'] = result.io_stats.as_dict()
+    
+    # Strings from the files (codecs) are not always valid UTF-8
+    return json.dumps(record, sort_keys=True, encoding='latin-1')
+
+
+def main(argv=None):
+    option_parser = create_option_parser()
+    options, args = option_parser.parse_args(argv)
+    
+    probe_metrics = None
+    depth_callback = None
+    if options.metrics_port is not None or options.metrics_file:
+        probe_metrics = metrics.ProbeMetrics()
+        depth_callback = probe_metrics.queue_depth_callback('threads')
+    
+    metrics_server = None
+    if options.metrics_port is not None:
+        metrics_server = probe_metrics.registry.serve(options.metrics_port)
+    
+    video_parser = videoparser.VideoParser(
+        io_stats=options.io_stats, cache_file=options.cache,
+        max_probe_bytes=options.max_bytes, max_read_size=options.max_read,
+        probe_timeout=options.timeout, metrics=probe_metrics)
+    
+    separator = options.null and '\0' or '\n'
+    if not args:
+        args = ['-']
+    paths = (path for arg in args
+             for path in (arg == '-' and read_paths(sys.stdin, separator)
+                          or [arg]))
+    
+    # Files named explicitly are parsed whatever their extension, files in
+    # directories are selected on their extension or signature
+    file_types = None
+    if not options.signature:
+        file_types = [file_type for parser in video_parser.parsers
+                      for file_type in parser._file_types]
+    
+    # Only the files found in directories have a filestat
+    def probe_file(filename, filestat):
+        return probe(video_parser, filename, filestat,
+                     options.signature and filestat is not None)
+    
+    # The parsers print diagnostics, which must not end up in the output
+    output = sys.stdout
+    sys.stdout = sys.stderr
+    
+    failed = 0
+    metrics_written = time.time()
+    try:
+        for filename, outcome in pool.probe_threads(
+                expand_paths(paths, file_types), probe_file,
+                options.workers, None, options.by_directory, depth_callback):
+            if (options.metrics_file and
+                time.time() - metrics_written >= options.metrics_interval):
+                probe_metrics.registry.write(options.metrics_file)
+                metrics_written = time.time()
+            
+            if outcome is None:
+                continue
+            
+            result, elapsed = outcome
+            if result is None or isinstance(result, Exception):
+                failed += 1
+            
+            # Written per file for the next command in the pipeline
+            output.write(format_result(filename, result, elapsed,
+                                       options.io_stats) + '\n')
+            output.flush()
+    except KeyboardInterrupt:
+        return 130
+    except IOError, err:
+        # The reader of the output went away, for example head
+        if err.errno != errno.EPIPE:
+            raise
+    finally:
+        sys.stdout = output
+        video_parser.close()
+        if options.metrics_file:
+            probe_metrics.registry.write(options.metrics_file)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+    
+    return failed and 1 or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
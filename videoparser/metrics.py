@@ -0,0 +1,344 @@
+""" Metrics of the probes in the Prometheus text format. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import os
+import threading
+
+
+# Buckets of the probe and phase durations in seconds
+duration_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets of the bytes read by a probe
+size_buckets = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216, 67108864)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+def _format_labels(names, values, extra=''):
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', r'\\')
+                                           .replace('"', r'\"')
+                                           .replace('\n', r'\n'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(pairs)
+
+
+class Metric(object):
+    """ Base class of the metrics, which hold a value per combination of
+        label values. The labels of the update methods are a tuple with a
+        value for each of the label names. Metrics without labels start at
+        zero, the others have no value until they are first updated. """
+    type = None
+    
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        
+        if not self.label_names:
+            self._values[()] = self._new_value()
+    
+    def _new_value(self):
+        return 0
+    
+    def _check_labels(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError("Metric %s has the labels %s" % (
+                self.name, ', '.join(self.label_names) or 'none'))
+    
+    def get(self, labels=()):
+        """ Return the value for the labels. """
+        with self._lock:
+            return self._values.get(tuple(labels), 0)
+    
+    def samples(self):
+        """ Return a list of (suffix, labels, value) tuples. """
+        with self._lock:
+            return [('', _format_labels(self.label_names, labels), value)
+                    for labels, value in sorted(self._values.items())]
+    
+    def exposition(self):
+        """ Return the metric in the Prometheus text format. """
+        lines = ['# HELP %s %s' % (self.name, self.help.replace('\\', r'\\')
+                                                       .replace('\n', r'\n')),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        for suffix, labels, value in self.samples():
+            lines.append('%s%s%s %s' % (self.name, suffix, labels,
+                                        _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    """ A value which only increases, such as the number of probes. """
+    type = 'counter'
+    
+    def inc(self, amount=1, labels=()):
+        labels = tuple(labels)
+        self._check_labels(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """ A value which goes up and down, such as the length of a queue. """
+    type = 'gauge'
+    
+    def set(self, value, labels=()):
+        labels = tuple(labels)
+        self._check_labels(labels)
+        with self._lock:
+            self._values[labels] = value
+    
+    def inc(self, amount=1, labels=()):
+        labels = tuple(labels)
+        self._check_labels(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+
+class Histogram(Metric):
+    """ Counts the observed values in buckets with the given upper bounds,
+        and keeps their sum and number. """
+    type = 'histogram'
+    
+    def __init__(self, name, help, buckets, label_names=()):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        Metric.__init__(self, name, help, label_names)
+    
+    def _new_value(self):
+        # Count per bucket, sum and number of the values
+        return [[0] * len(self.buckets), 0, 0]
+    
+    def observe(self, value, labels=()):
+        labels = tuple(labels)
+        self._check_labels(labels)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = self._new_value()
+            
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+    
+    def get(self, labels=()):
+        """ Return the number and sum of the values for the labels. """
+        with self._lock:
+            state = self._values.get(tuple(labels))
+            if state is None:
+                return 0, 0
+            return state[2], state[1]
+    
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (counts, total, count) in sorted(
+                    self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(('_bucket', _format_labels(
+                        self.label_names, labels,
+                        'le="%s"' % _format_value(bound)), cumulative))
+                
+                plain = _format_labels(self.label_names, labels)
+                samples.append(('_sum', plain, total))
+                samples.append(('_count', plain, count))
+        return samples
+
+
+class MetricsRegistry(object):
+    """ A set of metrics which can be exported in the Prometheus text format,
+        by write() to a file or by serve() on a local HTTP endpoint.
+        
+        Example:
+            registry = MetricsRegistry()
+            files = registry.counter('files_total', 'Number of files')
+            files.inc()
+            print registry.exposition()"""
+    
+    def __init__(self):
+        self._metrics = []
+        self._names = set()
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._names:
+                raise ValueError("Metric %s is already registered" %
+                                 metric.name)
+            self._names.add(metric.name)
+            self._metrics.append(metric)
+        return metric
+    
+    def counter(self, name, help, label_names=()):
+        return self.register(Counter(name, help, label_names))
+    
+    def gauge(self, name, help, label_names=()):
+        return self.register(Gauge(name, help, label_names))
+    
+    def histogram(self, name, help, buckets, label_names=()):
+        return self.register(Histogram(name, help, buckets, label_names))
+    
+    def exposition(self):
+        """ Return all metrics in the Prometheus text format. """
+        with self._lock:
+            metrics = list(self._metrics)
+        return ''.join([metric.exposition() for metric in metrics])
+    
+    def write(self, filename):
+        """ Write the metrics to filename. The file is replaced at once, so
+            a collector (like the textfile collector of the node exporter)
+            never reads a partial file. """
+        temporary = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary, 'w') as fh:
+            fh.write(self.exposition())
+        os.rename(temporary, filename)
+    
+    def serve(self, port, address='127.0.0.1'):
+        """ Serve the metrics on http://address:port/metrics from a
+            background thread. Returns the server, call its shutdown()
+            method to stop it. """
+        import BaseHTTPServer
+        
+        registry = self
+        
+        class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                
+                data = registry.exposition()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        server = BaseHTTPServer.HTTPServer((address, port),
+                                           MetricsRequestHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+
+class ProbeMetrics(object):
+    """ The metrics of the probes of one or more VideoParsers, which pass
+        them to its timing_callback(), io_stats_callback() and
+        queue_depth_callback() when created with metrics=ProbeMetrics(). The
+        metrics are registered in registry, a new MetricsRegistry by
+        default:
+        
+            videoparser_probes_total            files parsed, per plugin
+            videoparser_probe_failures_total    files no plugin could parse
+            videoparser_plugin_failures_total   failed attempts, per plugin
+            videoparser_probe_duration_seconds  duration of the probes
+            videoparser_phase_duration_seconds  duration per phase and plugin
+            videoparser_read_bytes              bytes read per probe
+            videoparser_read_calls_total        read calls of all probes
+            videoparser_queue_depth             files waiting or being
+                                                probed, per pool
+        
+        The plugin of a file is its container type. The probes in the worker
+        processes of VideoParser.parse_many() are counted by the parent
+        process as their results arrive."""
+    
+    def __init__(self, registry=None):
+        if registry is None:
+            registry = MetricsRegistry()
+        self.registry = registry
+        
+        self.probes = registry.counter(
+            'videoparser_probes_total', 'Files parsed, per plugin.',
+            ['plugin'])
+        self.probe_failures = registry.counter(
+            'videoparser_probe_failures_total',
+            'Files which no plugin could parse.')
+        self.plugin_failures = registry.counter(
+            'videoparser_plugin_failures_total',
+            'Failed attempts to parse a file, per plugin.', ['plugin'])
+        self.probe_duration = registry.histogram(
+            'videoparser_probe_duration_seconds', 'Duration of the probes.',
+            duration_buckets)
+        self.phase_duration = registry.histogram(
+            'videoparser_phase_duration_seconds',
+            'Duration of the phases of the probes, per plugin.',
+            duration_buckets, ['phase', 'plugin'])
+        self.read_bytes = registry.histogram(
+            'videoparser_read_bytes', 'Bytes read per probe.', size_buckets)
+        self.read_calls = registry.counter(
+            'videoparser_read_calls_total', 'Read calls of all probes.')
+        self.queue_depth = registry.gauge(
+            'videoparser_queue_depth',
+            'Files waiting or being probed, per pool.', ['pool'])
+    
+    def timing_callback(self, filename, phase, plugin, seconds, success):
+        if phase == 'probe':
+            self.probe_duration.observe(seconds)
+            if not success:
+                self.probe_failures.inc()
+            return
+        
+        self.phase_duration.observe(seconds, (phase, plugin or ''))
+        if phase == 'parse':
+            if success:
+                self.probes.inc(labels=(plugin,))
+            else:
+                self.plugin_failures.inc(labels=(plugin,))
+    
+    def io_stats_callback(self, filename, stats):
+        if stats is not None:
+            self.read_bytes.observe(stats.bytes_read)
+            self.read_calls.inc(stats.reads)
+    
+    def queue_depth_callback(self, pool):
+        """ Return a function which sets the queue depth of pool. """
+        return lambda depth: self.queue_depth.set(depth, (pool,))
@@ -22,11 +22,87 @@
 #  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import videoparser.streams as streams
 import videoparser.types as types
 
 
+# The plugin modules with the file types and signatures of their parser, in
+# the order in which the parsers are tried. This is the only place they are
+# listed: the Parser classes take theirs from here with registration(), and
+# the VideoParser matches files against them without importing the plugins.
+parser_plugins = [
+    ('asf', ['wmv'],
+     [[(0, streams.string_to_guid('75B22630-668E-11CF-A6D9-00AA0062CE6C'))]]),
+    ('matroska', ['mkv'], [[(0, '\x1a\x45\xdf\xa3')]]),
+    ('avi', ['avi'], [[(0, 'RIFF'), (8, 'AVI ')]]),
+    ('realmedia', ['rm'], [[(0, '.RMF')]]),
+    ('quicktime', ['mov', 'mp4'], [[(4, 'ftyp')], [(4, 'moov')]]),
+]
+
+
+def registration(name):
+    """ Return the file types and signatures of the plugin module name. """
+    for plugin_name, file_types, signatures in parser_plugins:
+        if plugin_name == name:
+            return file_types, signatures
+    raise KeyError("Unknown plugin '%s'" % name)
+
+
 class BaseParser(object):
-    pass
+    """ Base class of the parser plugins.
+    
+        parse(stream, video) is called with a streams.BinaryStream positioned
+        at the start of the file and set to the _endianess of the parser. The
+        stream is owned by the caller, parsers must not close it.
+        
+        _signatures lists the magic bytes which identify the files of the
+        parser. Each signature is a list of (offset, bytes) tuples which must
+        all match the start of the file. The _file_types and _signatures of
+        a plugin are registered in parser_plugins."""
+    _file_types = []
+    _signatures = []
+    
+    def match_signature(self, header):
+        """ Return True if header, the start of the file, matches one of the
+            signatures of the parser. """
+        for signature in self._signatures:
+            for offset, magic in signature:
+                if header[offset:offset + len(magic)] != magic:
+                    break
+            else:
+                return True
+        return False
+
+
+class LazyParser(BaseParser):
+    """ Stands in for the Parser of the plugin module name, with the file
+        types and signatures of the parser. The module is imported when a
+        file is first parsed with it, matching the signatures doesn't need
+        the module. """
+    
+    def __init__(self, name, file_types, signatures):
+        self.name = name
+        self._file_types = file_types
+        self._signatures = signatures
+        self._parser = None
+    
+    def get_parser(self):
+        if self._parser is None:
+            module = __import__("videoparser.plugins." + self.name,
+                                None, None, "plugins")
+            self._parser = module.Parser()
+        return self._parser
+    parser = property(fget=get_parser)
+    
+    def get_endianess(self):
+        return self.parser._endianess
+    _endianess = property(fget=get_endianess)
+    
+    def parse(self, stream, video):
+        return self.parser.parse(stream, video)
+    
+    def __repr__(self):
+        return "<LazyParser %s>" % self.name
 
 
 
@@ -32,10 +32,11 @@ __all__ = ['Parser']
 # Project modules
 import videoparser.plugins as plugins
 import videoparser.streams as streams
+import videoparser.timing as timing
 
 
 # Only implement required information to retrieve video and audio information
-guid_list = {
+guid_names = {
     'D2D0A440-E307-11D2-97F0-00A0C95EA850':
                                     'ASF_Extended_Content_Description_Object',
     '75B22630-668E-11CF-A6D9-00AA0062CE6C': 'ASF_Header_Object',
@@ -60,32 +61,35 @@ guid_list = {
     '1806D474-CADF-4509-A4BA-9AABCB96AAE8': 'ASF_Padding_Object',
 }
 
+# The guid_names indexed by the raw GUID as returned by read_guid()
+guid_list = dict([(streams.string_to_guid(guid), name)
+                  for guid, name in guid_names.items()])
+
 
 
 
 class Parser(plugins.BaseParser):
     _endianess = streams.endian.little
-    _file_types = ['wmv']
+    _file_types, _signatures = plugins.registration('asf')
     
     def __init__(self):
         plugins.BaseParser.__init__(self)
         
-    def parse(self, filename, video):
+    def parse(self, stream, video):
         
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
-            
         object_id   = stream.read_guid()
         
         if guid_list.get(object_id) != 'ASF_Header_Object':
             return False
 
         try:                    
-            header = self.parse_header(stream)
+            with timing.span(stream.timer, 'tree'):
+                header = self.parse_header(stream)
         except AssertionError:
             return False
     
-        self.extract_information(header, video)
+        with timing.span(stream.timer, 'extract'):
+            self.extract_information(header, video)
         return True
     
     
@@ -169,7 +173,8 @@ class Parser(plugins.BaseParser):
                 object_type = guid_list[guid]
             except:
                 # Unrecognized object, skip over it
-                raise AssertionError("Unregognized object: %s" % guid)
+                raise AssertionError("Unregognized object: %s" %
+                                     streams.guid_to_string(guid))
                 stream.skip(size - 24)
                 continue
             
@@ -483,7 +488,8 @@ class Parser(plugins.BaseParser):
                      
         def __repr__(self):
             buffer  = "FileProperties Structure: \n"
-            buffer += " %-30s: %s\n" % ('File ID', self.id)
+            buffer += " %-30s: %s\n" % ('File ID',
+                                        streams.guid_to_string(self.id))
             buffer += " %-30s: %s\n" % ('File Size', self.size)
             buffer += " %-30s: %s\n" % ('Creation Date', self.create_date)
             buffer += " %-30s: %s\n" % ('Data Packets Count',
@@ -506,7 +512,8 @@ class Parser(plugins.BaseParser):
     class HeaderExtension(Structure):
         def __repr__(self):
             buffer  = "HeaderExtension Structure: \n"
-            buffer += " %-30s: %s\n" % ('Reserved_1', self.reserved_1)
+            buffer += " %-30s: %s\n" % (
+                'Reserved_1', streams.guid_to_string(self.reserved_1))
             buffer += " %-30s: %s\n" % ('Reserved_2', self.reserved_2)
             buffer += " %-30s: %s\n" % ('Header Extension Data Size',
                                         self.size)
@@ -568,7 +575,8 @@ class Parser(plugins.BaseParser):
         
         def __repr__(self):
             buffer  = "CodecList Structure: \n"
-            buffer += " %-30s: %s\n" % ('Reserved', self.reserved)
+            buffer += " %-30s: %s\n" % ('Reserved',
+                                        streams.guid_to_string(self.reserved))
             buffer += " %-30s: %s\n" % ('Codec Entries Count', self.num_codecs)
             buffer += " %-30s\n" % ('Codec Entries')
             buffer += self.repr_childs(self.codec_entries)
@@ -34,22 +34,18 @@ if __name__ == "__main__":
 # Project modules
 import videoparser.plugins as plugins
 import videoparser.streams as streams
+import videoparser.timing as timing
 
 
 class Parser(plugins.BaseParser):
     """ Parser for AVI RIFF Containers """
     _endianess = streams.endian.little
-    _file_types = ['avi']
+    _file_types, _signatures = plugins.registration('avi')
     
     def __init__(self):
         plugins.BaseParser.__init__(self)
-        
-        self._parse_level = 0
-        self._last_stream_header = None
 
-    def parse(self, filename, video):
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
+    def parse(self, stream, video):
 
         # Read fourcc
         if stream.read(4) != 'RIFF':
@@ -61,8 +57,10 @@ class Parser(plugins.BaseParser):
         
         # Parse the first block (which is a header)
         
-        header = self._parse_block(stream)
-        self._extract_information(header, video)
+        with timing.span(stream.timer, 'tree'):
+            header = self._parse_block(stream)
+        with timing.span(stream.timer, 'extract'):
+            self._extract_information(header, video)
         return True
     
     
@@ -97,12 +95,12 @@ class Parser(plugins.BaseParser):
                                                           'Unknown'))
         
     
-    def _parse_block(self, stream):
+    def _parse_block(self, stream, stream_header=None):
         id = stream.read(4)
         if id == 'LIST':
             return self._parse_list(stream)
         else:
-            return self._parse_chunk(stream, id)
+            return self._parse_chunk(stream, id, stream_header)
             
     def _parse_list(self, stream):
         item = self.ListItem()
@@ -112,15 +110,21 @@ class Parser(plugins.BaseParser):
         
         item.childs = []
         
+        # The format of a strf chunk depends on the type in the strh chunk
+        # before it in the same list
+        stream_header = None
+        
         data = stream.read_subsegment(item.size-4 )
         while data.tell() < item.size - 4:
-            sub_item = self._parse_block(data)
+            sub_item = self._parse_block(data, stream_header)
+            if isinstance(sub_item, self.AVIStreamHeader):
+                stream_header = sub_item
             item.childs.append(sub_item)
 
         
         return item
 
-    def _parse_chunk(self, stream, chunk_id):
+    def _parse_chunk(self, stream, chunk_id, stream_header):
         
         chunk_size = stream.read_uint32()
         chunk_size += chunk_size % 2 # Align to dword
@@ -133,11 +137,11 @@ class Parser(plugins.BaseParser):
             elif chunk_id == 'strh':
                 return self._parse_streamheader(data)
                 
-            elif chunk_id == 'strf':
-                if self._last_stream_header.type == 'vids':
+            elif chunk_id == 'strf' and stream_header is not None:
+                if stream_header.type == 'vids':
                     return data.read_bitmapinfoheader()
 
-                elif self._last_stream_header.type == 'auds':
+                elif stream_header.type == 'auds':
                     return data.read_waveformatex()
 
                 else:
@@ -149,41 +153,40 @@ class Parser(plugins.BaseParser):
 
     def _parse_streamheader(self, data):
         header = self.AVIStreamHeader()
-        header.type = data.read(4)
-        header.handler = data.read(4)
-        header.flags = data.read_uint32()
-        header.priority = data.read_uint16()
-        header.language = data.read_uint16()
-        header.initial_frames = data.read_uint32()
-        header.scale = data.read_uint32()
-        header.rate  = data.read_uint32()
-        header.start = data.read_uint32()
-        header.length = data.read_uint32()
-        header.suggested_buffer_size = data.read_uint32()
-        header.quality = data.read_uint32()
-        header.sample_size = data.read_uint32()
-        header.frame_left = data.read_uint8()
-        header.frame_top = data.read_uint8()
-        header.frame_right = data.read_uint8()
-        header.frame_bottom = data.read_uint8()
+        (header.type,
+         header.handler,
+         header.flags,
+         header.priority,
+         header.language,
+         header.initial_frames,
+         header.scale,
+         header.rate,
+         header.start,
+         header.length,
+         header.suggested_buffer_size,
+         header.quality,
+         header.sample_size,
+         header.frame_left,
+         header.frame_top,
+         header.frame_right,
+         header.frame_bottom) = data.read_struct('4s4sIHH8I4B')
         
-        self._last_stream_header = header
         return header
         
     
     def _parse_mainheader(self, data):
         header = self.AVIMainHeader()
-        header.ms_per_frame         = data.read_uint32()
-        header.max_bytes_per_frame  = data.read_uint32()
-        header.padding_granularity  = data.read_uint32()
-        header.flags                = data.read_uint32()
-        header.total_frames         = data.read_uint32()
-        header.initial_frames       = data.read_uint32()
-        header.streams              = data.read_uint32()
-        header.suggested_buffer_size    = data.read_uint32()
-        header.width        = data.read_uint32()
-        header.height       = data.read_uint32()
-        header.reserved     = data.read_uint32()
+        (header.ms_per_frame,
+         header.max_bytes_per_frame,
+         header.padding_granularity,
+         header.flags,
+         header.total_frames,
+         header.initial_frames,
+         header.streams,
+         header.suggested_buffer_size,
+         header.width,
+         header.height,
+         header.reserved) = data.read_struct('11I')
         
         return header
 
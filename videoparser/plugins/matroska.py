@@ -28,9 +28,13 @@
     See http://www.matroska.org/technical/specs/index.html
 """
 
+# Python built-in modules
+import struct
+
 # Project modules
 import videoparser.plugins as plugins
 import videoparser.streams as streams
+import videoparser.timing as timing
 
 __all__ = ['Parser']
 
@@ -106,21 +110,45 @@ class_ids = {
 }
 
 
+# EBML variable length integers: the length in bytes is the number of leading
+# zero bits of the first byte + 1. Lookup table for the length by first byte,
+# 0 is invalid.
+vint_length = [0] * 256
+for _octet in range(1, 256):
+    vint_length[_octet] = 9 - _octet.bit_length()
+
+# Mask to remove the length marker from a vint of n bytes. A size with all the
+# remaining bits set means the size of the element is unknown.
+vint_mask = [(1 << (7 * _length)) - 1 for _length in range(0, 9)]
+
+_uint32 = struct.Struct('>I')
+_uint64 = struct.Struct('>Q')
+_float = struct.Struct('>f')
+
+# Master elements which are skipped, nothing in them is used
+skipped_elements = ['Info', 'SeekHead', 'Cluster', 'Cues']
+
+
+def _read_uint(data):
+    """ Convert a big endian unsigned integer of any length. """
+    if len(data) <= 8:
+        return _uint64.unpack(data.rjust(8, '\x00'))[0]
+    
+    value = 0
+    for octet in data:
+        value = (value << 8) | ord(octet)
+    return value
 
 
 class Parser(plugins.BaseParser):
     _endianess = streams.endian.big
-    _file_types = ['mkv']
+    _file_types, _signatures = plugins.registration('matroska')
     
     def __init__(self, *args, **kwargs):
         plugins.BaseParser.__init__(self, *args, **kwargs)
 
         
-    def parse(self, filename, video):
-        
-        
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
+    def parse(self, stream, video):
 
         # Check if this is an EBML file
         if stream.read_uint32() != 0x1a45dfa3:
@@ -129,8 +157,10 @@ class Parser(plugins.BaseParser):
         
         video.set_container('matroska')
         
-        tree = self._build_tree(stream)
-        self._extract_information(tree, video)
+        with timing.span(stream.timer, 'tree'):
+            tree = self._build_tree(stream)
+        with timing.span(stream.timer, 'extract'):
+            self._extract_information(tree, video)
     
         return True
 
@@ -215,80 +245,176 @@ class Parser(plugins.BaseParser):
         # element, and the binary data itself.
         
         while stream.bytes_left():
-            # Fetch the element id
-            octet = stream.read_byte()
+            # Fetch the element id and the descriptor for the size of the
+            # element
+            class_id = self.read_element_id(stream)
+            length = self.read_element_size(stream)
             
-            classid_size, classid_bytes = self.parse_octet(octet)
+            try:
+                class_name, class_type, class_level = class_ids[class_id]
+            except KeyError:
+                # Skip the element, its content is not known
+                print "Unhandled class-id: %s" % hex(class_id)
+                if length is None:
+                    return
+                stream.seek(stream.tell() + length)
+                continue
             
-            # Read all the bytes from the complete class-id:
-            if classid_size > 1:
-                class_id = stream.convert_uintvar(octet +
-                                                  stream.read(classid_size-1))
-            else:
-                class_id = ord(octet)
+            # Only master elements (live streams) may have an unknown size
+            if length is None and class_type != types.sub_elements:
+                raise AssertionError("Unknown size for element %s" %
+                                     class_name)
             
-            # Fetch the descriptor for the size of the element
-            octet = stream.read_byte()
-            length_bytes, length =  self.parse_octet(octet)
-            length = stream.convert_uintvar(chr(length) +
-                                            stream.read(length_bytes-1))
+            value = None
+            if class_type == types.string:
+                value = stream.read(length)
+                
+            elif class_type == types.u_integer:
+                value = self.read_uint(stream, length)
+
+            elif class_type == types.binary:
+                stream.seek(stream.tell() + length)
             
-            try:
-                value = None
-                class_name, class_type, class_level = class_ids[class_id]
+            elif class_type == types.float:
+                value = stream.read_float()
                 
-                if class_type == types.string:
-                    value = stream.read(length)
-                    
-                elif class_type == types.u_integer:
-                    value = stream.convert_uintvar(stream.read(length))
-    
-                elif class_type == types.binary:
+            elif class_type == types.utf_8:
+                value = stream.read(length)
+                
+            elif class_type == types.sub_elements:
+                if class_name in skipped_elements:
+                    if length is None:
+                        return
                     stream.seek(stream.tell() + length)
+                    continue
                 
-                elif class_type == types.float:
-                    value = stream.read_float()
-                    
-                elif class_type == types.utf_8:
-                    value = stream.read(length)
-                    
-                elif class_type == types.sub_elements:
-                    if class_name in ['Info', 'SeekHead', 'Cluster', 'Cues']:
-                        stream.seek(stream.tell() + length)
-                        continue
-                    
-                yield (class_name, value, class_level)
+                # Small master elements are read at once and their children
+                # are decoded from memory
+                if length is not None and length <= streams.binary.copy_size:
+                    yield (class_name, value, class_level)
+                    for element in self.parse_data(stream.read(length)):
+                        yield element
+                    continue
                 
+            yield (class_name, value, class_level)
+    
+    
+    def parse_data(self, data):
+        """ Iterate over the elements in the string data like parse_header
+            does for a stream, without a read call for every id, size and
+            value. """
+        
+        position = 0
+        end = len(data)
+        
+        while position < end:
+            # Element id, the length marker is part of the id
+            octet = ord(data[position])
+            length = vint_length[octet]
+            if not 0 < length <= 4:
+                raise AssertionError("Invalid element id: %r" % data[position])
+            
+            if length == 1:
+                class_id = octet
+            else:
+                class_id = _uint32.unpack(
+                    data[position:position + length].rjust(4, '\x00'))[0]
+            position += length
+            
+            if position >= end:
+                raise AssertionError("Element without a size")
+            
+            # Element size, all ones in the remaining bits is an unknown size
+            octet = ord(data[position])
+            length = vint_length[octet]
+            if not length:
+                raise AssertionError("Invalid element size: %r" %
+                                     data[position])
+            
+            if length == 1:
+                size = octet & 0x7f
+            else:
+                size = _uint64.unpack(
+                    data[position:position + length].rjust(8, '\x00'))[0] \
+                    & vint_mask[length]
+            if size == vint_mask[length]:
+                size = None
+            position += length
+            
+            try:
+                class_name, class_type, class_level = class_ids[class_id]
             except KeyError:
-                #raise AssertionError("Unhandled class-id: %s" % hex(class_id))
                 print "Unhandled class-id: %s" % hex(class_id)
+                if size is None:
+                    return
+                position += size
+                continue
+            
+            if size is None and class_type != types.sub_elements:
+                raise AssertionError("Unknown size for element %s" %
+                                     class_name)
+            
+            value = None
+            if class_type == types.string or class_type == types.utf_8:
+                value = data[position:position + size]
+                position += size
+                
+            elif class_type == types.u_integer:
+                value = _read_uint(data[position:position + size])
+                position += size
+                
+            elif class_type == types.binary:
+                position += size
+                
+            elif class_type == types.float:
+                value = _float.unpack(data[position:position + 4])[0]
+                position += 4
+                
+            elif class_name in skipped_elements:
+                if size is None:
+                    return
+                position += size
                 continue
+                
+            yield (class_name, value, class_level)
     
     
-    def parse_octet(self, octet):
-        """ Retrieve the length of the class-id. """
+    def read_element_id(self, stream):
+        """ Read an element id, the length marker is part of the id. """
+        data = stream.read(1)
+        length = vint_length[ord(data)]
         
-        octet = ord(octet)
-
-        # The bytesize of the class-id is the number of leading 0 bits + 1
-        # The value stored in this byte is with the marker bit removed (which
-        #  is the highest bit)
+        # Element ids are at most 4 bytes long
+        if not 0 < length <= 4:
+            raise AssertionError("Invalid element id: %r" % data)
         
-        if octet == 0x00:
-            return (None, None)
-
-        # Calculate the length of the class-id            
-        mask = 0x80
-        length = 1
-        while mask:
-            if octet & mask:
-                break
-
-            length += 1
-            mask >>= 1
-
-        # return the bytesize and the value with the marker bit xor'ed out
-        return (length, octet ^ 2**(8-length))
+        if length > 1:
+            data += stream.read(length - 1)
+        return _uint32.unpack(data.rjust(4, '\x00'))[0]
+    
+    
+    def read_element_size(self, stream):
+        """ Read the size of an element, returns None if the size is unknown.
+        """
+        data = stream.read(1)
+        length = vint_length[ord(data)]
+        
+        if not length:
+            raise AssertionError("Invalid element size: %r" % data)
+        
+        if length > 1:
+            data += stream.read(length - 1)
+        
+        # Remove the length marker
+        size = _uint64.unpack(data.rjust(8, '\x00'))[0] & vint_mask[length]
+        if size == vint_mask[length]:
+            return None
+        return size
+    
+    
+    def read_uint(self, stream, length):
+        """ Read an unsigned integer element of length bytes. """
+        return _read_uint(stream.read(length))
 
 
     class LevelElement(object):
@@ -33,10 +33,13 @@ if __name__ == "__main__":
     import sys; sys.path.append('../../'); sys.path.append('..')
 
 import datetime
+import itertools
+import operator
 
 # Project modules
 import videoparser.plugins as plugins
 import videoparser.streams as streams
+import videoparser.timing as timing
 
 # Define the structure of the movie atom
 atom_structure = {
@@ -108,15 +111,12 @@ atom_structure = {
 
 class Parser(plugins.BaseParser):
     _endianess = streams.endian.big
-    _file_types = ['mov', 'mp4']
+    _file_types, _signatures = plugins.registration('quicktime')
     
     def __init__(self):
         plugins.BaseParser.__init__(self)
-        self._tkhd_subtype = None
         
-    def parse(self, filename, video):
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
+    def parse(self, stream, video):
 
         # Make sure that we are dealing with a quicktime file format
         if stream.read(12) != '\x00\x00\x00 ftypqt  ':
@@ -127,18 +127,21 @@ class Parser(plugins.BaseParser):
             
         stream.seek(0)
         
-        # Build a tree with all information extracted
+        # Build a tree with all information extracted, the context holds
+        # the state shared by the atom handlers during this parse
         dest_tree = {}
         try:
-            self.parse_atom(stream, atom_tree=atom_structure,
-                            dest_tree=dest_tree)
+            with timing.span(stream.timer, 'tree'):
+                self.parse_atom(stream, atom_tree=atom_structure,
+                                dest_tree=dest_tree, context={})
         except AssertionError:
             raise
             return False
         
         # Extract required information from the tree and place it in the
         # videofile object
-        self.extract_information(dest_tree, video)
+        with timing.span(stream.timer, 'extract'):
+            self.extract_information(dest_tree, video)
         
         video.set_container("QuickTime")
         return True
@@ -146,7 +149,7 @@ class Parser(plugins.BaseParser):
     def parse_ftyp(self, data):
         print repr(data)
         
-    def parse_atom(self, data, atom_tree=None, dest_tree=None):
+    def parse_atom(self, data, atom_tree=None, dest_tree=None, context=None):
 
         while data.bytes_left():
             atom_data = None
@@ -180,13 +183,14 @@ class Parser(plugins.BaseParser):
                 atom_data = data.read_subsegment(atom_size - 8)
 
                 self.parse_atom(atom_data, atom_tree=atom_tree_item[1],
-                                dest_tree=dest_tree[atom_type][idx])
+                                dest_tree=dest_tree[atom_type][idx],
+                                context=context)
             
             # Parse the data in the atom with the specified handler method
             elif handler:
                 atom_data = data.read_subsegment(atom_size - 8)
                 method = self.__class__.__getattribute__(self, handler)
-                dest_tree[atom_type] = method(atom_data)
+                dest_tree[atom_type] = method(atom_data, context)
             
             # Don't read the data, since we are not processing it
             else:
@@ -212,12 +216,10 @@ class Parser(plugins.BaseParser):
                 stream.set_height(sample_table['height'])
                 stream.set_codec(sample_table['format'])
                 
-                # Calculate the framerate
-                stream_duration = 0
-                frames = 0
-                for s_count, s_duration in sample_atom['stts'].sample_table:
-                    stream_duration += (s_count * s_duration)
-                    frames += s_count
+                # Calculate the framerate, the time-to-sample table contains
+                # (sample count, sample duration) pairs
+                stream_duration, frames = self._sum_sample_table(
+                    sample_atom['stts'].sample_table)
                     
                 stream.set_framerate(timescale / (stream_duration /
                                                   float(frames)))
@@ -232,7 +234,23 @@ class Parser(plugins.BaseParser):
                 stream.set_bit_per_sample(sample_table['bits'])
 
 
-    def validate_file_format(self, data):
+    def _sum_sample_table(self, table):
+        """ Return the total duration and the number of samples in a
+            time-to-sample table. """
+        counts = table[0::2]
+        durations = table[1::2]
+        
+        # NumPy array, widen to 64 bits so the products don't overflow
+        if hasattr(table, 'astype'):
+            counts = counts.astype('u8')
+            durations = durations.astype('u8')
+            return int(counts.dot(durations)), int(counts.sum())
+        
+        return (sum(itertools.imap(operator.mul, counts, durations)),
+                sum(counts))
+        
+
+    def validate_file_format(self, data, context):
         major_brand = data.read(4)
         minor_version = data.read(4)
 
@@ -249,47 +267,55 @@ class Parser(plugins.BaseParser):
     
     
 
-    def parse_movie_header_atom(self, data):
+    def parse_movie_header_atom(self, data, context):
         obj = self.MovieHeaderAtom()
-        obj.version = data.read_uint8()
-        obj.flags = data.read(3)
-        obj.creation_time = data.read_timestamp_mac()
-        obj.modification_time = data.read_timestamp_mac()
-        obj.timescale = data.read_uint32()
-        obj.duration = data.read_uint32()
-        obj.preferred_rate = data.read_uint32()
-        obj.preferred_volume = data.read_uint16()
-        obj.reserved_1 = data.read(10)
-        obj.matrix = data.read(36)
-        obj.preview_time = data.read_uint32()
-        obj.preview_duration = data.read_uint32()
-        obj.poster_time = data.read_uint32()
-        obj.selection_time = data.read_uint32()
-        obj.selection_duration = data.read_uint32()
-        obj.current_time = data.read_uint32()
-        obj.next_track_id = data.read_uint32()
+        (obj.version,
+         obj.flags,
+         creation_time,
+         modification_time,
+         obj.timescale,
+         obj.duration,
+         obj.preferred_rate,
+         obj.preferred_volume,
+         obj.reserved_1,
+         obj.matrix,
+         obj.preview_time,
+         obj.preview_duration,
+         obj.poster_time,
+         obj.selection_time,
+         obj.selection_duration,
+         obj.current_time,
+         obj.next_track_id) = data.read_struct('B3s5IH10s36s7I')
+        
+        obj.creation_time = data.convert_timestamp_mac(creation_time)
+        obj.modification_time = data.convert_timestamp_mac(modification_time)
         return obj
 
-    def parse_track_header_atom(self, data):
+    def parse_track_header_atom(self, data, context):
         obj = self.TrackHeaderAtom()
-        obj.version = data.read_uint8()
-        obj.flags = data.read(3)
-        obj.creation_time = data.read_timestamp_mac()
-        obj.modification_time = data.read_timestamp_mac()
-        obj.track_id = data.read_uint32()
-        obj.reserved_1 = data.read(4)
-        obj.duration = data.read_uint32()
-        obj.reserved_2 = data.read(8)
-        obj.layer = data.read_uint16()
-        obj.alt_group = data.read_uint16()
-        obj.volume = data.read_uint16()
-        obj.reserved_3 = data.read(2)
-        obj.matrix = data.read(36)
-        obj.width = data.read_qtfloat_32()
-        obj.height = data.read_qtfloat_32()
+        (obj.version,
+         obj.flags,
+         creation_time,
+         modification_time,
+         obj.track_id,
+         obj.reserved_1,
+         obj.duration,
+         obj.reserved_2,
+         obj.layer,
+         obj.alt_group,
+         obj.volume,
+         obj.reserved_3,
+         obj.matrix,
+         width, width_fraction,
+         height, height_fraction) = data.read_struct('B3s3I4sI8s3H2s36shHhH')
+        
+        obj.creation_time = data.convert_timestamp_mac(creation_time)
+        obj.modification_time = data.convert_timestamp_mac(modification_time)
+        obj.width = width + float(width_fraction) / 65535
+        obj.height = height + float(height_fraction) / 65535
         return obj
         
-    def parse_handler_reference_atom(self, data):
+    def parse_handler_reference_atom(self, data, context):
         obj = self.HandlerReferenceAtom()
         obj.version = data.read_uint8()
         obj.flags = data.read(3)
@@ -300,26 +326,25 @@ class Parser(plugins.BaseParser):
         obj.cflags_mask = data.read_uint32()
         obj.name = data.read(data._filesize - data.tell())
         
-        # FIXME: This is a louse hack, but we need to know the subtype to parse
-        # the stsd atom correctly (subtype specifies if this is a sound or
-        # video track or something else (tmcd)
-        self._tkhd_subtype = obj.subtype
+        # We need to know the subtype to parse the stsd atom of the track
+        # correctly (subtype specifies if this is a sound or video track or
+        # something else (tmcd)
+        context['subtype'] = obj.subtype
         return obj
         
 
-    def parse_time_to_sample_atom(self, data):
+    def parse_time_to_sample_atom(self, data, context):
         obj = self.TimeToSampleAtom()
         obj.version = data.read_uint8()
         obj.flags = data.read(3)
         obj.num_entries = data.read_uint32()
-        obj.sample_table = []
         
-        for i in range(0, obj.num_entries):
-            obj.sample_table.append((data.read_uint32(), data.read_uint32()))
+        # Flat array of (sample count, sample duration) pairs
+        obj.sample_table = data.read_array('I', obj.num_entries * 2)
 
         return obj
     
-    def parse_sample_descr_atom(self, data):
+    def parse_sample_descr_atom(self, data, context):
         obj = self.SampleDescrAtom()
         obj.version = data.read_uint8()
         obj.flags = data.read(3)
@@ -327,7 +352,8 @@ class Parser(plugins.BaseParser):
         
         obj.sample_table = []
         
-        assert(self._tkhd_subtype is not None)
+        subtype = context.get('subtype')
+        assert(subtype is not None)
         for i in range(0, obj.num_entries):
             size = data.read_uint32()
             
@@ -340,7 +366,7 @@ class Parser(plugins.BaseParser):
             table_entry['version'] = data.read_uint16()
             table_entry['revision'] = data.read_uint16()
             
-            if self._tkhd_subtype == 'vide':
+            if subtype == 'vide':
                 table_entry['vendor'] =  repr(data.read_dword())
                 table_entry['temporal_quality'] =  data.read_int32()
                 table_entry['spatial_quality'] =  data.read_int32()
@@ -354,7 +380,7 @@ class Parser(plugins.BaseParser):
                 table_entry['depth'] =  data.read_uint16()
                 table_entry['color_table_id'] =  data.read_int16()
                 
-            if self._tkhd_subtype == 'soun':
+            if subtype == 'soun':
                 table_entry['vendor'] =  data.read_uint32()
                 table_entry['channels'] =  data.read_uint16()
                 table_entry['bits'] =  data.read_uint16()
@@ -443,9 +469,11 @@ if __name__ == "__main__":
     import plugins
     video = videofile.VideoFile()
     p = Parser()
-    if not p.parse(sys.argv[1], video):
-        print "This is not a quicktime file.."
-        sys.exit(1)
+    with streams.factory.create_filestream(sys.argv[1],
+                                           p._endianess) as stream:
+        if not p.parse(stream, video):
+            print "This is not a quicktime file.."
+            sys.exit(1)
         
     print video
     
@@ -31,27 +31,30 @@
 
 import videoparser.plugins as plugins
 import videoparser.streams as streams
+import videoparser.timing as timing
 import videoparser.types as types
 
 class Parser(plugins.BaseParser):
     _endianess = streams.endian.big
-    _file_types = ['rm']
+    _file_types, _signatures = plugins.registration('realmedia')
     
     def __init__(self):
         plugins.BaseParser.__init__(self)
 
-    def parse(self, filename, video):
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
+    def parse(self, stream, video):
         if stream.read_fourcc() != '.RMF':
             return False
         stream.seek(0)
         
-        data = self.parse_objects(stream)
+        video.set_container('RealMedia')
+        
+        with timing.span(stream.timer, 'tree'):
+            data = self.parse_objects(stream)
 
         # Extract required information from the tree and place it in the
         # videofile object
-        self.extract_information(data, video)
+        with timing.span(stream.timer, 'extract'):
+            self.extract_information(data, video)
         
         return True
 
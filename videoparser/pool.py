@@ -0,0 +1,466 @@
+""" Worker pool to run probes in the background. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import Queue
+import errno
+import itertools
+import os
+import sys
+import threading
+
+import videoparser.streams as streams
+
+
+class ProbeTimeout(Exception):
+    """ Raised by ProbeFuture.result() when the probe didn't finish in time.
+    """
+    pass
+
+
+class ProbeError(Exception):
+    """ An exception raised by a probe in a worker process, the original
+        exception can't always be transferred between processes. """
+    pass
+
+
+class ProbeFuture(object):
+    """ The result of a probe running in the background.
+    
+        result() waits for the probe and returns the videofile.VideoFile
+        object (or None when no parser matched), or raises the exception
+        raised by the probe. Callbacks added with add_done_callback() are
+        called with the future as argument from the worker thread, or
+        directly when the probe already finished."""
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._exc_info = None
+    
+    def done(self):
+        return self._event.is_set()
+    
+    def result(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise ProbeTimeout("Probe of '%s' did not finish" % self.filename)
+        
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+    
+    def exception(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise ProbeTimeout("Probe of '%s' did not finish" % self.filename)
+        
+        if self._exc_info:
+            return self._exc_info[1]
+        return None
+    
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+    
+    def _finish(self, result=None, exc_info=None):
+        with self._lock:
+            self._result = result
+            self._exc_info = exc_info
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        
+        for callback in callbacks:
+            callback(self)
+
+
+class ProbePool(object):
+    """ Threads which run the probes submitted with submit().
+    
+        At most workers probes run at the same time, each worker thread has
+        its own parser created by parser_factory. When max_pending is set,
+        submit() blocks while that many probes are waiting for a worker.
+        
+        The reads of the parsers release the interpreter lock, so probes on
+        slow storage overlap.
+        
+        depth_callback, if given, is called with the number of probes which
+        are waiting or running whenever it changes."""
+    
+    def __init__(self, parser_factory, workers=4, max_pending=0,
+                 depth_callback=None):
+        self._queue = Queue.Queue(max_pending)
+        self._threads = []
+        self._depth_callback = depth_callback
+        self._depth = 0
+        self._depth_lock = threading.Lock()
+        
+        for i in range(workers):
+            thread = threading.Thread(target=self._work,
+                                      args=(parser_factory,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+    
+    def submit(self, filename):
+        """ Probe filename in the background, returns a ProbeFuture. """
+        future = ProbeFuture(filename)
+        if self._depth_callback is not None:
+            self._update_depth(1)
+        self._queue.put(future)
+        return future
+    
+    def _update_depth(self, change):
+        with self._depth_lock:
+            self._depth += change
+            self._depth_callback(self._depth)
+    
+    def shutdown(self, wait=True):
+        """ Stop the worker threads after the submitted probes finished. """
+        for thread in self._threads:
+            self._queue.put(None)
+        
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+    
+    def _work(self, parser_factory):
+        parser = parser_factory()
+        
+        while True:
+            future = self._queue.get()
+            if future is None:
+                break
+            
+            try:
+                video = parser.parse_file(future.filename)
+            except Exception:
+                exc_info = sys.exc_info()
+                video = None
+            else:
+                exc_info = None
+            
+            if self._depth_callback is not None:
+                self._update_depth(-1)
+            future._finish(video, exc_info)
+
+
+def probe_threads(filenames, probe, workers=4, max_pending=None,
+                  by_directory=False, depth_callback=None):
+    """ Probe filenames with probe(filename, filestat), for example the
+        parse_file() method of a VideoParser, in worker threads. Yields
+        (filename, result) tuples in the order the probes finish, the result
+        is the VideoFile, None when no parser matched or the exception
+        raised by the probe.
+        
+        The filenames can also be (filename, filestat) tuples with the
+        os.stat() result of the file, filestat is None otherwise.
+        
+        At most max_pending (default twice the number of workers) probes are
+        in flight. With by_directory consecutive files in the same directory
+        are probed one after another by the same worker and their results
+        are yielded in the given order, the window then counts directories.
+        
+        depth_callback, if given, is called with the number of files which
+        are waiting or being probed whenever it changes.
+        """
+    if max_pending is None:
+        max_pending = workers * 2
+    
+    entries = (isinstance(entry, tuple) and entry or (entry, None)
+               for entry in filenames)
+    if by_directory:
+        tasks = (list(group) for directory, group
+                 in itertools.groupby(entries,
+                                      lambda entry: os.path.dirname(entry[0])))
+    else:
+        tasks = ([entry] for entry in entries)
+    
+    task_queue = Queue.Queue()
+    results = Queue.Queue()
+    stopped = threading.Event()
+    threads = []
+    
+    for i in range(workers):
+        thread = threading.Thread(target=_probe_tasks,
+                                  args=(probe, task_queue, results, stopped))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    
+    pending = 0
+    pending_files = 0
+    try:
+        while True:
+            while pending < max_pending:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                task_queue.put(task)
+                pending += 1
+                pending_files += len(task)
+            
+            if not pending:
+                break
+            
+            if depth_callback is not None:
+                depth_callback(pending_files)
+            
+            # None marks the end of a task
+            result = results.get()
+            if result is None:
+                pending -= 1
+            else:
+                pending_files -= 1
+                yield result
+    finally:
+        if depth_callback is not None:
+            depth_callback(0)
+        
+        # Stops the workers after their current probe when the caller
+        # stopped iterating early
+        stopped.set()
+        for thread in threads:
+            task_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+def _probe_tasks(probe, task_queue, results, stopped):
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        
+        for filename, filestat in task:
+            if stopped.is_set():
+                break
+            try:
+                results.put((filename, probe(filename, filestat)))
+            except Exception, err:
+                results.put((filename, err))
+        results.put(None)
+
+
+# The VideoParser of a worker process and the queue on which it reports the
+# chunks it starts, set by _init_process()
+_process_parser = None
+_started_queue = None
+
+# The calls of the timing and I/O stats callbacks during the current probe
+# of a worker process, sent to the parent with the result
+_callback_calls = []
+
+def _record_timing(*args):
+    _callback_calls.append(('timing', args))
+
+def _record_io_stats(*args):
+    _callback_calls.append(('io_stats', args))
+
+def _init_process(options, started_queue=None, record_callbacks=False):
+    global _process_parser, _started_queue
+    import multiprocessing.util
+    import videoparser
+    if record_callbacks:
+        options = dict(options, timing_callback=_record_timing,
+                       io_stats_callback=_record_io_stats)
+    _process_parser = videoparser.VideoParser(**options)
+    _started_queue = started_queue
+    
+    # Writes the result cache when the worker exits
+    multiprocessing.util.Finalize(_process_parser, _process_parser.close,
+                                  exitpriority=10)
+
+def _probe_chunk(chunk_id, filenames):
+    # Tells the parent which chunk is lost if this process dies
+    if _started_queue is not None:
+        _started_queue.put((chunk_id, os.getpid()))
+    
+    results = []
+    for filename in filenames:
+        del _callback_calls[:]
+        try:
+            result = _process_parser.parse_file(filename)
+        except streams.ProbeLimit, err:
+            result = err
+        except Exception, err:
+            result = ProbeError("%s: %s" % (err.__class__.__name__, err))
+        results.append((filename, result, list(_callback_calls)))
+    return chunk_id, results
+
+
+def probe_processes(filenames, options, workers=None, chunksize=16,
+                    max_pending=None, depth_callback=None,
+                    timing_callback=None, io_stats_callback=None):
+    """ Probe filenames in a pool of worker processes, each with its own
+        VideoParser created with the options. Yields (filename, result)
+        tuples in the order the probes finish, the result is the VideoFile,
+        None when no parser matched, the streams.ProbeLimit when the probe
+        exceeded a limit or a ProbeError when the probe failed otherwise.
+        
+        The filenames are sent to the workers in chunks of chunksize, at most
+        max_pending chunks (default twice the number of workers) are in
+        flight so filenames can be a generator of any length.
+        
+        When a worker process dies, for example killed on running out of
+        memory, the files of the chunk it was probing are probed again one
+        at a time by the new worker. A file whose worker dies when it is
+        probed on its own gets a ProbeError.
+        
+        depth_callback, if given, is called with the number of files which
+        are waiting or being probed whenever it changes.
+        
+        The calls the VideoParser of a worker makes to timing_callback and
+        io_stats_callback are recorded and repeated in this process before
+        the result of the file is yielded, see VideoParser."""
+    import multiprocessing
+    import multiprocessing.queues
+    
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if max_pending is None:
+        max_pending = workers * 2
+    
+    results = Queue.Queue()
+    
+    # Not a multiprocessing.Queue, its puts are done by a thread which
+    # might not run before the worker dies
+    started_queue = multiprocessing.queues.SimpleQueue()
+    callbacks = {'timing': timing_callback, 'io_stats': io_stats_callback}
+    process_pool = multiprocessing.Pool(
+        workers, _init_process,
+        (options, started_queue,
+         timing_callback is not None or io_stats_callback is not None))
+    filenames = iter(filenames)
+    chunk_ids = itertools.count()
+    
+    # The chunks in flight, their AsyncResult and the process which started
+    # them, by chunk id
+    chunks = {}
+    jobs = {}
+    started = {}
+    retries = []
+    pending_files = 0
+    finished = False
+    
+    try:
+        while True:
+            while len(chunks) < max_pending:
+                if retries:
+                    chunk = [retries.pop(0)]
+                else:
+                    chunk = list(itertools.islice(filenames, chunksize))
+                if not chunk:
+                    break
+                chunk_id = next(chunk_ids)
+                chunks[chunk_id] = chunk
+                jobs[chunk_id] = process_pool.apply_async(
+                    _probe_chunk, (chunk_id, chunk), callback=results.put)
+                pending_files += len(chunk)
+            
+            if not chunks:
+                break
+            
+            if depth_callback is not None:
+                depth_callback(pending_files)
+            
+            # The pool doesn't report the tasks of workers which died, so
+            # they are checked whenever no result arrived for a while
+            try:
+                chunk_id, chunk_results = results.get(timeout=1)
+            except Queue.Empty:
+                lost = _lost_chunks(started_queue, started, chunks)
+                if not lost:
+                    continue
+                
+                # The pool waits for the results of its tasks when it is
+                # joined, and has no public way to drop the task of a worker
+                # which died. Without this close() and join() would hang.
+                chunk_id = lost[0]
+                cache = getattr(process_pool, '_cache', None)
+                if cache is not None:
+                    cache.pop(getattr(jobs[chunk_id], '_job', None), None)
+                
+                chunk = chunks[chunk_id]
+                if len(chunk) > 1:
+                    del chunks[chunk_id], jobs[chunk_id], started[chunk_id]
+                    pending_files -= len(chunk)
+                    retries.extend(chunk)
+                    continue
+                
+                chunk_results = [(chunk[0], ProbeError(
+                    "The worker process probing the file died"), [])]
+            
+            # A chunk reported lost might still deliver its results
+            if chunks.pop(chunk_id, None) is None:
+                continue
+            del jobs[chunk_id]
+            started.pop(chunk_id, None)
+            
+            pending_files -= len(chunk_results)
+            for filename, result, calls in chunk_results:
+                for name, args in calls:
+                    callback = callbacks[name]
+                    if callback is not None:
+                        callback(*args)
+                yield filename, result
+        
+        finished = True
+    finally:
+        if depth_callback is not None:
+            depth_callback(0)
+        
+        # Stops the workers right away when the caller stopped iterating
+        # early, otherwise they exit cleanly
+        if finished:
+            process_pool.close()
+        else:
+            process_pool.terminate()
+        process_pool.join()
+
+def _lost_chunks(started_queue, started, chunks):
+    """ Return the ids of the chunks in flight which were started by worker
+        processes that are no longer alive. """
+    while not started_queue.empty():
+        chunk_id, pid = started_queue.get()
+        if chunk_id in chunks:
+            started[chunk_id] = pid
+    
+    return [lost_id for lost_id, worker_pid in started.items()
+            if not _process_alive(worker_pid)]
+
+def _process_alive(pid):
+    """ Return True if the process with the pid exists. A worker which died
+        is reaped by the pool within a tenth of a second, after that its pid
+        no longer exists. """
+    try:
+        os.kill(pid, 0)
+    except OSError, err:
+        return err.errno == errno.EPERM
+    return True
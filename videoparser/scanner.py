@@ -0,0 +1,140 @@
+""" Walk directory trees for the files to probe. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import os
+import stat
+
+# scandir() returns the file type with the directory entries, which saves a
+# stat() call for every directory and filtered file
+try:
+    from scandir import scandir
+except ImportError:
+    scandir = getattr(os, 'scandir', None)
+
+
+def walk_files(top, file_types=None, followlinks=False):
+    """ Walk the tree below top and yield a (path, filestat) tuple for each
+        regular file, where filestat is the os.stat() result of the file.
+        
+        When file_types is given only the files with one of these extensions
+        (without dot, case insensitive) are returned, the others are not
+        stat()ed when the directory entries have their type (scandir()) or
+        the link count of the directory shows it has no subdirectories left,
+        see _list_directory(). Directories which can't be read are skipped.
+        Symbolic links to directories are only followed when followlinks is
+        set."""
+    if file_types is not None:
+        file_types = set(['.' + file_type.lower()
+                          for file_type in file_types])
+    
+    directories = [top]
+    while directories:
+        directory = directories.pop()
+        if scandir is not None:
+            entries = _scan_directory(directory, file_types, followlinks)
+        else:
+            entries = _list_directory(directory, file_types, followlinks)
+        
+        subdirectories = []
+        for path, filestat in entries:
+            if filestat is None:
+                subdirectories.append(path)
+            else:
+                yield path, filestat
+        
+        # Pop the subdirectories in the order they were found
+        subdirectories.reverse()
+        directories.extend(subdirectories)
+
+
+def _match_type(name, file_types):
+    return (file_types is None or
+            os.path.splitext(name)[1].lower() in file_types)
+
+
+def _scan_directory(directory, file_types, followlinks):
+    """ Yield (path, filestat) for the files and (path, None) for the
+        subdirectories in directory, using scandir(). """
+    try:
+        entries = scandir(directory)
+    except OSError:
+        return
+    
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=followlinks):
+                yield entry.path, None
+            elif _match_type(entry.name, file_types) and entry.is_file():
+                yield entry.path, entry.stat()
+        except OSError:
+            # Removed while walking or a dangling symbolic link
+            continue
+
+
+def _list_directory(directory, file_types, followlinks):
+    """ Yield (path, filestat) for the files and (path, None) for the
+        subdirectories in directory, using listdir() and lstat().
+        
+        Only lstat() tells whether an entry is a directory, but the link
+        count of a directory is two plus its number of subdirectories on
+        most file systems. Once that many subdirectories are found the
+        entries with other extensions are skipped without lstat(), unless
+        followlinks is set (a symbolic link might point to a directory) or
+        the link count is below two (btrfs and some network file systems
+        don't count the subdirectories). """
+    try:
+        names = os.listdir(directory)
+        nlink = os.stat(directory).st_nlink
+    except OSError:
+        return
+    
+    subdirectories_left = None
+    if nlink >= 2 and file_types is not None and not followlinks:
+        subdirectories_left = nlink - 2
+    
+    for name in names:
+        if subdirectories_left == 0 and not _match_type(name, file_types):
+            continue
+        
+        path = os.path.join(directory, name)
+        try:
+            filestat = os.lstat(path)
+            if subdirectories_left and stat.S_ISDIR(filestat.st_mode):
+                subdirectories_left -= 1
+            if stat.S_ISLNK(filestat.st_mode):
+                if not followlinks and not _match_type(name, file_types):
+                    continue
+                filestat = os.stat(path)
+                if stat.S_ISDIR(filestat.st_mode) and not followlinks:
+                    continue
+        except OSError:
+            # Removed while walking or a dangling symbolic link
+            continue
+        
+        if stat.S_ISDIR(filestat.st_mode):
+            yield path, None
+        elif stat.S_ISREG(filestat.st_mode) and _match_type(name, file_types):
+            yield path, filestat
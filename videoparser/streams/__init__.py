@@ -23,6 +23,10 @@
 #
 
 from videoparser.streams.binary import BinaryStream
+from videoparser.streams.binary import guid_to_string, string_to_guid
+from videoparser.streams.mapped import MappedStream
+from videoparser.streams.stats import IOStats
+from videoparser.streams.budget import ProbeBudget, ProbeLimit
 from videoparser.streams import factory
 from videoparser.streams import endian
 
@@ -28,42 +28,205 @@
 # Only implement required information to retrieve video and audio information
 
 
+import array
+import cStringIO
 import datetime
+import sys
 
 import struct
-import cStringIO
+
+# NumPy is optional, read_array() returns array.array objects without it.
+# The import is slow, so it is imported by the first read_array().
+numpy = False
+
+def _import_numpy():
+    global numpy
+    if numpy is False:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
 
 
 from videoparser.streams import endian
 
 
+# Compiled struct.Struct objects per endianess, see get_struct()
+_struct_cache = {endian.little: {}, endian.big: {}}
+_byte_order = {endian.little: '<', endian.big: '>'}
+
+def get_struct(format, endianess):
+    """ Return a compiled struct.Struct for format. The byte order of the
+        endianess is used unless the format starts with its own byte order
+        character."""
+    try:
+        return _struct_cache[endianess][format]
+    except KeyError:
+        pass
+    
+    if format[0] in '<>!=@':
+        compiled = struct.Struct(format)
+    else:
+        compiled = struct.Struct(_byte_order[endianess] + format)
+    
+    _struct_cache[endianess][format] = compiled
+    return compiled
+
+
+_uint64 = {endian.little: struct.Struct('<Q'), endian.big: struct.Struct('>Q')}
+
+# GUID fields, see http://www.ietf.org/rfc/rfc4122.txt for specification. The
+# first three fields are stored little endian in ASF files.
+_guid_struct = struct.Struct('<IHHBB6s')
+
+def guid_to_string(guid):
+    """ Format a GUID read by BinaryStream.read_guid() as text. """
+    time_low, time_mid, time_hi, clock_seq_hi, clock_seq_low, node = \
+        _guid_struct.unpack(guid)
+    return "%08X-%04X-%04X-%02X%02X-%s" % (time_low, time_mid, time_hi,
+                                           clock_seq_hi, clock_seq_low,
+                                           node.encode('hex').upper())
+
+def string_to_guid(text):
+    """ Convert a GUID in text format to the 16 bytes returned by
+        BinaryStream.read_guid(). """
+    fields = text.split('-')
+    return _guid_struct.pack(int(fields[0], 16), int(fields[1], 16),
+                             int(fields[2], 16), int(fields[3][:2], 16),
+                             int(fields[3][2:], 16), fields[4].decode('hex'))
+
+
+# Subsegments up to this size are read with one read and parsed from memory,
+# larger ones are views on the file object which read only what is parsed
+copy_size = 65536
+
+
+if sys.byteorder == 'little':
+    _native_endianess = endian.little
+else:
+    _native_endianess = endian.big
+
+# NumPy dtypes for the struct types accepted by read_array()
+_numpy_types = {'b': 'i1', 'B': 'u1', 'h': 'i2', 'H': 'u2', 'i': 'i4',
+                'I': 'u4', 'q': 'i8', 'Q': 'u8', 'f': 'f4', 'd': 'f8'}
+
+# array.array typecodes with the same size as the struct types, the size of
+# the C types behind the typecodes differs per platform
+_array_types = {}
+for _type, _typecodes in [('b', 'b'), ('B', 'B'), ('h', 'h'), ('H', 'H'),
+                          ('i', 'il'), ('I', 'IL'), ('q', 'l'), ('Q', 'L'),
+                          ('f', 'f'), ('d', 'd')]:
+    for _typecode in _typecodes:
+        if array.array(_typecode).itemsize == struct.calcsize('<' + _type):
+            _array_types[_type] = _typecode
+            break
+
+
 class BinaryStream(object):
+    """ Stream of binary data on top of a file-like object.
+    
+        A BinaryStream is a window (offset and size) on the underlying file
+        object. Subsegments of more than copy_size bytes returned by
+        read_subsegment() share the file object of their parent, so large
+        structures are not copied. Smaller subsegments are read at once and
+        parsed from memory, as are their own subsegments.
+        
+        The stream closes the file object when it is closed (or used as a
+        context manager) if it owns the file object.
+        
+        Reads are checked against the budget.ProbeBudget, if given, before
+        they are done."""
     
-    def __init__(self, fileobj, filesize, endianess=endian.little):
+    def __init__(self, fileobj, filesize, endianess=endian.little,
+                 stats=None, owner=True, budget=None):
         self._endianess = endianess
         self._fileobj = fileobj
         self._filesize = filesize
         
+        # stats.IOStats object which counts the I/O, shared with subsegments
+        self._stats = stats
+        
+        # budget.ProbeBudget which limits the reads, shared with subsegments
+        self._budget = budget
+        
+        # timing.PhaseTimer of the probe, set by the VideoParser when the
+        # probe is timed and shared with subsegments
+        self.timer = None
+        
+        # Start of this window in the file object and the position relative
+        # to that start
+        self._offset = 0
+        self._position = 0
+        
+        # Position of the file object, shared with all subsegments so that
+        # sequential reads don't need a seek on the file object
+        self._cursor = [None]
+        
+        # Only the stream which owns the file object closes it, subsegments
+        # never do
+        self._owner = owner
+        
     def __del__(self):
         self.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
         
     def read(self, length):
         if not length:
             return ''
         
-        return self._fileobj.read(length)
+        position = self._position
+        remaining = self._filesize - position
+        if remaining <= 0:
+            return ''
+        
+        if length < 0 or length > remaining:
+            length = remaining
+        
+        if self._budget is not None:
+            self._budget.charge(length)
+        
+        offset = self._offset + position
+        if self._cursor[0] != offset:
+            self._fileobj.seek(offset)
+        
+        data = self._fileobj.read(length)
+        self._position = position + len(data)
+        self._cursor[0] = offset + len(data)
+        
+        stats = self._stats
+        if stats is not None:
+            stats.reads += 1
+            stats.bytes_read += len(data)
+            if len(data) > stats.max_read:
+                stats.max_read = len(data)
+        return data
 
     def tell(self):
-        return self._fileobj.tell()
+        return self._position
     
     def seek(self, position):
-        return self._fileobj.seek(position)
+        stats = self._stats
+        if stats is not None:
+            stats.seeks += 1
+            if position < self._position:
+                stats.backward_seeks += 1
+        self._position = position
     
     def close(self):
-        return self._fileobj.close()
+        """ Close the file object if this stream owns it. """
+        if self._owner:
+            self._owner = False
+            self._fileobj.close()
 
     def bytes_left(self):
-        return self._fileobj.tell() < self._filesize
+        return self._position < self._filesize
 
     def set_endianess(self, endianess):
         self._endianess = endianess
@@ -79,14 +242,53 @@ class BinaryStream(object):
         assert len(data) == length, "Unexpected end of stream"
         
         try:
-            if self._endianess == endian.big:
-                return struct.unpack('>' + type, data)[0]
-            else:
-                return struct.unpack('<' + type, data)[0]
+            compiled = _struct_cache[self._endianess][type]
+        except KeyError:
+            compiled = get_struct(type, self._endianess)
+        
+        try:
+            return compiled.unpack(data)[0]
         except struct.error:
             print len(data)
             print "Unable to unpack '%r'" % data
             raise
+    
+    def read_struct(self, format, record=None):
+        """ Read a complete structure with one unpack. Returns a tuple with
+            the values, or record(*values) when a record type (for example
+            a namedtuple) is given."""
+        compiled = get_struct(format, self._endianess)
+        data = self.read(compiled.size)
+        
+        assert len(data) == compiled.size, "Unexpected end of stream"
+        
+        if record is not None:
+            return record(*compiled.unpack(data))
+        return compiled.unpack(data)
+        
+    def read_array(self, type, count):
+        """ Read count values of the struct type (for example 'I') with one
+            read. Returns a numpy array when NumPy is available, otherwise an
+            array.array (or a tuple when the platform has no typecode of the
+            right size)."""
+        itemsize = get_struct(type, self._endianess).size
+        data = self.read(itemsize * count)
+        
+        assert len(data) == itemsize * count, "Unexpected end of stream"
+        
+        if _import_numpy() is not None:
+            return numpy.frombuffer(data, _byte_order[self._endianess] +
+                                    _numpy_types[type])
+        
+        typecode = _array_types.get(type)
+        if typecode is None:
+            return struct.unpack(_byte_order[self._endianess] +
+                                 '%d%s' % (count, type), data)
+        
+        values = array.array(typecode, data)
+        if self._endianess != _native_endianess:
+            values.byteswap()
+        return values
         
     def read_float(self):
         """ Read a 32bit float."""
@@ -108,7 +310,7 @@ class BinaryStream(object):
 
     def read_int64(self):
         """ Read an signed 64bit integer."""
-        return self.unpack('q', 4)
+        return self.unpack('q', 8)
         
     def read_uint32(self):
         """ Read an unsigned 32bit integer."""
@@ -132,7 +334,7 @@ class BinaryStream(object):
     
     def read_int8(self):
         """ Read a signed 8bit integer."""
-        return struct.unpack('b', self.read(1))[0]
+        return self.unpack('b', 1)
     
     def read_dword(self):
         return self.read(4)
@@ -152,8 +354,12 @@ class BinaryStream(object):
     
     def read_timestamp_mac(self):
         """ Read a timestamp in mac format (seconds sinds 1904) """
+        return self.convert_timestamp_mac(self.read_uint32())
+    
+    def convert_timestamp_mac(self, seconds):
+        """ Convert a timestamp in mac format (seconds sinds 1904) """
         timestamp_base = datetime.datetime(1904, 1, 1, 0, 0)
-        timestamp_value = datetime.timedelta(seconds=self.read_uint32())
+        timestamp_value = datetime.timedelta(seconds=seconds)
         return timestamp_base + timestamp_value
 
     def read_timestamp_win(self):
@@ -176,18 +382,43 @@ class BinaryStream(object):
             return unicode(data, "UTF-16-LE")
     
     def read_subsegment(self, length):
-        data = self.read(length)
-        return BinaryStream(cStringIO.StringIO(data), len(data),
-                            self._endianess)
+        """ Return a BinaryStream for the next length bytes of the stream
+            and skip over them. Up to copy_size bytes are read into memory,
+            a larger subsegment is a view on the same file object and no
+            data is read."""
+        position = self._position
+        remaining = max(self._filesize - position, 0)
+        if length < 0 or length > remaining:
+            length = remaining
+        
+        if length <= copy_size:
+            return _memory_stream(self, self.read(length))
+        
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(self.__dict__)
+        view._offset = self._offset + position
+        view._filesize = length
+        view._position = 0
+        view._owner = False
+        
+        if self._stats is not None:
+            self._stats.subsegments += 1
+        
+        self._position = position + length
+        return view
     
     def convert_uintvar(self, data, endianess=None):
         """ Convert a string of variable length to an integer """
         
-        # using struct.unpack is twice as fast as this function, however
-        # it's not flexible enough
-        
         if endianess is None:
             endianess = self._endianess
+        
+        # Widen the string to 64 bits so struct can unpack it
+        if len(data) <= 8:
+            if endianess == endian.big:
+                return _uint64[endianess].unpack(data.rjust(8, '\x00'))[0]
+            else:
+                return _uint64[endianess].unpack(data.ljust(8, '\x00'))[0]
             
         if endianess == endian.big:
             data = data[::-1]
@@ -202,41 +433,12 @@ class BinaryStream(object):
 
     # ASF Specification requires the guid type, which is 128 bits aka 16 bytes
     def read_guid(self):
-        # See http://www.ietf.org/rfc/rfc4122.txt for specification
-        # The version number is in the most significant 4 bits of the time
-        # stamp (bits 4 through 7 of the time_hi_and_version field).
-        # Python 2.5 includes a built-in guid module, which should be used
-        
-        
-        # retrieve version        
-        position = self.tell()
-        self.seek(position + 6)
-        version = self.read_uint16() >> 12
-        self.seek(position)
+        """ Read a GUID, returned as the raw 16 bytes which can be used as
+            key. Use guid_to_string() to display it."""
+        data = self.read(16)
         
-        #print repr([hex(ord(x)) for x in self.read(16)])
-        
-        self.seek(position)
-        
-        time_low = self.read_uint32() 
-        time_mid = self.read_uint16()
-        time_hi  = self.read_uint16()
-        clock_seq_hi    = self.read_uint8()
-        clock_seq_low   = self.read_uint8()
-        node            = self.read(6)
-        
-        #print "uuid version = %d - %X" % (version, time_low)
-        if version == 1:
-            node = self.convert_uintvar(node, endian.big)
-        else:
-            node = self.convert_uintvar(node, endian.big)
-        
-        return "%08X-%04X-%04X-%X%X-%012X" % (time_low,
-                                            time_mid,
-                                            time_hi,
-                                            clock_seq_hi,
-                                            clock_seq_low,
-                                            node)
+        assert len(data) == 16, "Unexpected end of stream"
+        return data
                                      
     def read_waveformatex(self):
         obj = self.WAVEFORMATEX()
@@ -321,3 +523,63 @@ class BinaryStream(object):
             
             return buffer    
 
+
+class _MemoryStream(BinaryStream):
+    """ Subsegment read into memory by BinaryStream.read_subsegment(). The
+        data was counted in the IOStats and charged to the ProbeBudget when
+        it was read, so the reads and seeks are those of a cStringIO object
+        on the data and they are not counted again. Its subsegments copy
+        their part of the data, which is at most copy_size bytes. """
+    
+    # Only set on the instance when the parent stream has them, a small
+    # __dict__ is cheaper to create for every nested structure
+    _stats = None
+    _budget = None
+    timer = None
+    _owner = False
+    
+    def read(self, length):
+        return self._fileobj.read(length)
+    
+    def tell(self):
+        return self._fileobj.tell()
+    
+    def seek(self, position):
+        self._fileobj.seek(position)
+    
+    def bytes_left(self):
+        return self._fileobj.tell() < self._filesize
+    
+    def read_subsegment(self, length):
+        return _memory_stream(self, self._fileobj.read(length))
+
+
+class _TimedMemoryStream(_MemoryStream):
+    """ _MemoryStream of a probe with a time limit, a probe which loops over
+        the same data would never reach it otherwise. """
+    
+    def read(self, length):
+        self._budget.check_deadline()
+        return self._fileobj.read(length)
+
+
+def _memory_stream(parent, data):
+    """ Return a _MemoryStream on data, a subsegment of parent. """
+    budget = parent._budget
+    if budget is None or budget.deadline is None:
+        stream = _MemoryStream.__new__(_MemoryStream)
+    else:
+        stream = _TimedMemoryStream.__new__(_TimedMemoryStream)
+        stream._budget = budget
+    
+    stream._endianess = parent._endianess
+    stream._fileobj = cStringIO.StringIO(data)
+    stream._filesize = len(data)
+    if parent.timer is not None:
+        stream.timer = parent.timer
+    
+    stats = parent._stats
+    if stats is not None:
+        stream._stats = stats
+        stats.subsegments += 1
+    return stream
@@ -0,0 +1,71 @@
+""" Limits on the I/O and duration of a probe. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import time
+
+
+class ProbeLimit(Exception):
+    """ Raised by a BinaryStream when a probe exceeds its ProbeBudget. """
+    pass
+
+
+class ProbeBudget(object):
+    """ Limits for the reads through one or more BinaryStreams, shared by a
+        stream and the subsegments created from it. A read which exceeds a
+        limit raises ProbeLimit.
+        
+        max_bytes limits the total number of bytes read, max_read the size
+        of a single read (and so the memory allocated for it) and timeout
+        the number of seconds from the creation of the budget until the
+        last read. Limits which are None are not checked."""
+    __slots__ = ['max_bytes', 'max_read', 'deadline', 'bytes_read']
+    
+    def __init__(self, max_bytes=None, max_read=None, timeout=None):
+        self.max_bytes = max_bytes
+        self.max_read = max_read
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = time.time() + timeout
+        self.bytes_read = 0
+    
+    def charge(self, length):
+        """ Account for a read of length bytes, before it is done. """
+        if self.max_read is not None and length > self.max_read:
+            raise ProbeLimit("Read of %d bytes exceeds the limit of %d bytes"
+                             % (length, self.max_read))
+        
+        self.bytes_read += length
+        if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+            raise ProbeLimit("Probe exceeds the limit of %d bytes read" %
+                             self.max_bytes)
+        
+        if self.deadline is not None and time.time() > self.deadline:
+            raise ProbeLimit("Probe exceeds its time limit")
+    
+    def check_deadline(self):
+        """ Raise ProbeLimit when the probe exceeds its time limit. """
+        if self.deadline is not None and time.time() > self.deadline:
+            raise ProbeLimit("Probe exceeds its time limit")
@@ -0,0 +1,129 @@
+""" Block cache for file objects used by BinaryStream. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+
+
+# Statistics returned by BlockCache.cache_info()
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses',
+                                                 'max_blocks', 'blocks',
+                                                 'block_size'])
+
+
+class BlockCache(object):
+    """ File-like object which reads the wrapped file object in aligned
+        blocks of block_size bytes and keeps the max_blocks most recently
+        used blocks in memory. Small reads and skips within a cached block
+        don't touch the wrapped file object.
+        
+        Reads larger than a block bypass the cache. When stats is an
+        IOStats object the hits and misses are added to it on close()."""
+    
+    def __init__(self, fileobj, block_size=65536, max_blocks=16, stats=None):
+        self._fileobj = fileobj
+        self._stats = stats
+        self._block_size = block_size
+        self._max_blocks = max_blocks
+        self._blocks = collections.OrderedDict()
+        self._position = 0
+        
+        # Most recently used block, most reads hit the same block as the
+        # previous read so this saves a reorder of the LRU
+        self._last_index = None
+        self._last_block = None
+        
+        self.hits = 0
+        self.misses = 0
+        
+    def _get_block(self, index):
+        if index == self._last_index:
+            self.hits += 1
+            return self._last_block
+        
+        block = self._blocks.pop(index, None)
+        if block is None:
+            self.misses += 1
+            self._fileobj.seek(index * self._block_size)
+            block = self._fileobj.read(self._block_size)
+            
+            if len(self._blocks) >= self._max_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self.hits += 1
+        
+        self._blocks[index] = block
+        self._last_index = index
+        self._last_block = block
+        return block
+    
+    def read(self, length=-1):
+        position = self._position
+        block_size = self._block_size
+        
+        if length < 0 or length > block_size:
+            self.misses += 1
+            self._fileobj.seek(position)
+            data = self._fileobj.read(length)
+            self._position = position + len(data)
+            return data
+        
+        index, start = divmod(position, block_size)
+        block = self._get_block(index)
+        data = block[start:start + length]
+        
+        # The read continues in the next block
+        if len(data) < length and len(block) == block_size:
+            block = self._get_block(index + 1)
+            data += block[:length - len(data)]
+        
+        self._position = position + len(data)
+        return data
+    
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self._position
+        elif whence == 2:
+            self._fileobj.seek(0, 2)
+            position += self._fileobj.tell()
+        self._position = position
+    
+    def tell(self):
+        return self._position
+    
+    def close(self):
+        if self._stats is not None:
+            self._stats.cache_hits += self.hits
+            self._stats.cache_misses += self.misses
+            self._stats = None
+        self._blocks.clear()
+        self._last_index = None
+        self._last_block = None
+        self._fileobj.close()
+    
+    def cache_info(self):
+        """ Return the hit and miss statistics of the cache. """
+        return CacheInfo(self.hits, self.misses, self._max_blocks,
+                         len(self._blocks), self._block_size)
@@ -26,18 +26,148 @@ import os
 import stat
 
 from videoparser.streams.binary import BinaryStream
+from videoparser.streams.mapped import MappedStream, PlainMappedStream
 
-def create_filestream(filename, endianess):
-    filesize = os.stat(filename)[stat.ST_SIZE]
+# The modules of mmap, the block cache and remote files are imported by the
+# first stream which uses them
+
+# Default for create_filestream(), map regular files in memory instead of
+# reading them through a file object.
+mmap_files = False
+
+# Defaults for create_filestream(), number of blocks kept in the block cache
+# (0 disables the cache) and the size of the blocks.
+cache_blocks = 0
+cache_block_size = 65536
+
+# Defaults for create_urlstream(), minimum size of a range request and the
+# distance to cached ranges which are merged into the same request.
+remote_request_size = 65536
+remote_merge_gap = 65536
+
+def create_filestream(filename, endianess, use_mmap=None, blocks=None,
+                      block_size=None, stats=None, filestat=None,
+                      budget=None):
+    """ Open filename, a local file or an url, as a stream.
+
+        With use_mmap regular files are mapped in memory. With blocks the
+        reads go through a BlockCache of that many blocks of block_size
+        bytes. The cache is meant for files on high-latency mounts (NFS,
+        FUSE) where every read is a round trip; it turns the small reads
+        of a probe into a few block reads. On a local disk those reads are
+        cheap already and the cache only adds overhead, which is why it is
+        off by default. tests/benchmark.py -d measures both for a given
+        read latency. """
+    if use_mmap is None:
+        use_mmap = mmap_files
+    if blocks is None:
+        blocks = cache_blocks
+    if block_size is None:
+        block_size = cache_block_size
+    
+    if is_url(filename):
+        return create_urlstream(filename, endianess, stats=stats,
+                                budget=budget)
+    
+    # The caller can pass the os.stat() result it already has
+    if filestat is None:
+        filestat = os.stat(filename)
+    filesize = filestat.st_size
     
     if filesize == 0:
         raise IOError("File %s is 0 bytes!" % filename)
     fh = open(filename, 'rb')
-    stream = BinaryStream(fh, filesize, endianess)
+    try:
+        # Only regular files can be mapped, use the file object for the
+        # others
+        if use_mmap and stat.S_ISREG(filestat.st_mode):
+            import mmap
+            try:
+                data = mmap.mmap(fh.fileno(), filesize,
+                                 access=mmap.ACCESS_READ)
+            except ValueError:
+                # The file shrank after it was stat()ed, read it with the
+                # file object at its current size
+                filesize = os.fstat(fh.fileno()).st_size
+                if filesize == 0:
+                    raise IOError("File %s is 0 bytes!" % filename)
+            except (mmap.error, EnvironmentError):
+                pass
+            else:
+                fh.close()
+                return _mapped_stream(data, filesize, endianess, stats,
+                                      budget=budget)
+        
+        if blocks:
+            from videoparser.streams.cache import BlockCache
+            fh = BlockCache(fh, block_size, blocks, stats)
+        
+        return BinaryStream(fh, filesize, endianess, stats, budget=budget)
+    except:
+        fh.close()
+        raise
+
+
+def is_url(filename):
+    """ Return True if filename is an url which create_urlstream() can read.
+    """
+    return filename.startswith('http://') or filename.startswith('https://')
+
+
+def create_urlstream(url, endianess, request_size=None, merge_gap=None,
+                     stats=None, budget=None):
+    if request_size is None:
+        request_size = remote_request_size
+    if merge_gap is None:
+        merge_gap = remote_merge_gap
+    
+    from videoparser.streams.remote import RangeFile, HTTPRangeFetcher
+    fh = RangeFile(HTTPRangeFetcher(url), request_size, merge_gap)
+    filesize = fh.get_size()
+    
+    if not filesize:
+        fh.close()
+        raise IOError("File %s is 0 bytes!" % url)
+    
+    stream = BinaryStream(fh, filesize, endianess, stats, budget=budget)
     return stream
 
 
-def create_stringstream(data, endianess):
-    fh = cStringIO.StringIO(data)
-    stream = BinaryStream(fh, len(data), endianess)
-    return stream
\ No newline at end of file
+def create_stringstream(data, endianess, stats=None, budget=None):
+    """ Create a stream on data in memory, a string or an object with the
+        buffer interface such as a bytearray, mmap or memoryview. The data
+        is not copied, except for a memoryview. """
+    if isinstance(data, memoryview):
+        # Python 2 has no buffer() of a memoryview
+        data = data.tobytes()
+    elif not isinstance(data, str):
+        # Slices of a buffer are strings, like those of an mmap
+        data = buffer(data)
+    
+    if not len(data):
+        raise IOError("Data is 0 bytes!")
+    return _mapped_stream(data, len(data), endianess, stats, owner=False,
+                          budget=budget)
+
+
+def create_fileobjstream(fileobj, endianess, stats=None, budget=None):
+    """ Create a stream on a seekable file object of the caller, which is
+        not closed with the stream. The stream starts at the beginning of
+        the file. """
+    fileobj.seek(0, 2)
+    filesize = fileobj.tell()
+    
+    if filesize == 0:
+        raise IOError("File object is 0 bytes!")
+    return BinaryStream(fileobj, filesize, endianess, stats, owner=False,
+                        budget=budget)
+
+
+def _mapped_stream(data, filesize, endianess, stats=None, owner=True,
+                   budget=None):
+    """ Return a MappedStream on data, a PlainMappedStream when there is
+        nothing to count or limit on its reads. """
+    if stats is None and budget is None:
+        return PlainMappedStream(data, filesize, endianess, owner=owner)
+    return MappedStream(data, filesize, endianess, stats, owner=owner,
+                        budget=budget)
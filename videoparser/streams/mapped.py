@@ -0,0 +1,72 @@
+""" BinaryStream reading from a memory mapped file. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from videoparser.streams.binary import BinaryStream
+
+
+class MappedStream(BinaryStream):
+    """ BinaryStream on top of an mmap object. Reads are slices of the
+        mapping, so no file object methods are called while parsing."""
+    
+    def read(self, length):
+        if not length:
+            return ''
+        
+        start = self._offset + self._position
+        end = self._offset + self._filesize
+        if length > 0 and start + length < end:
+            end = start + length
+        
+        if self._budget is not None and end > start:
+            self._budget.charge(end - start)
+        
+        data = self._fileobj[start:end]
+        self._position += len(data)
+        
+        stats = self._stats
+        if stats is not None:
+            stats.reads += 1
+            stats.bytes_read += len(data)
+            if len(data) > stats.max_read:
+                stats.max_read = len(data)
+        return data
+
+
+class PlainMappedStream(MappedStream):
+    """ MappedStream without IOStats and without a ProbeBudget, a read is
+        only the slice of the mapping. """
+    
+    def read(self, length):
+        position = self._position
+        end = self._filesize
+        if 0 <= length < end - position:
+            end = position + length
+        elif position >= end:
+            return ''
+        
+        offset = self._offset
+        self._position = end
+        return self._fileobj[offset + position:offset + end]
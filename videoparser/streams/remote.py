@@ -0,0 +1,278 @@
+""" Backends to read streams from remote servers using range requests. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# A backend is a file-like object with read(), seek(), tell() and close()
+# which BinaryStream uses as its file object. RangeFile implements one on top
+# of a fetcher, an object with a fetch(start, length) method which returns the
+# data of a byte range and a size attribute which is known after the first
+# fetch.
+
+import re
+
+
+class RangeFile(object):
+    """ File-like object which reads a remote file with range requests.
+    
+        Reads which are not cached are expanded to at least request_size
+        bytes and merged with cached ranges that are within merge_gap bytes,
+        so the gap between them is fetched in the same request. All fetched
+        ranges are kept until the file is closed."""
+    
+    def __init__(self, fetcher, request_size=65536, merge_gap=65536):
+        self._fetcher = fetcher
+        self._request_size = request_size
+        self._merge_gap = merge_gap
+        self._position = 0
+        
+        # Sorted list of non-overlapping (start, data) tuples
+        self._ranges = []
+        
+        # Number of requests and bytes fetched
+        self.requests = 0
+        self.bytes_fetched = 0
+        
+        # The first request retrieves the start of the file (where all
+        # containers keep their signature) and the size of the file
+        self._fetch(0, request_size)
+        self._size = fetcher.size
+        
+    def _fetch(self, start, end):
+        """ Fetch the range start - end and merge it with cached ranges. """
+        want_end = max(end, start + self._request_size)
+        if self._fetcher.size is not None:
+            want_end = min(want_end, self._fetcher.size)
+        
+        keep = []
+        merged = []
+        for range_start, range_data in self._ranges:
+            range_end = range_start + len(range_data)
+            if (range_end + self._merge_gap < start or
+                range_start > want_end + self._merge_gap):
+                keep.append((range_start, range_data))
+            else:
+                merged.append((range_start, range_data))
+        
+        # Cached data before and after the requested range is reused, anything
+        # between them is fetched with one request
+        prefix = suffix = None
+        fetch_start = start
+        fetch_end = want_end
+        if merged and merged[0][0] <= start:
+            prefix = merged[0]
+            fetch_start = prefix[0] + len(prefix[1])
+        if merged and merged[-1][0] + len(merged[-1][1]) >= want_end:
+            suffix = merged[-1]
+            fetch_end = suffix[0]
+        
+        data = self._fetcher.fetch(fetch_start, fetch_end - fetch_start)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        
+        pieces = [data]
+        new_start = fetch_start
+        if prefix:
+            pieces.insert(0, prefix[1])
+            new_start = prefix[0]
+        if suffix and len(data) == fetch_end - fetch_start:
+            pieces.append(suffix[1])
+        
+        keep.append((new_start, ''.join(pieces)))
+        keep.sort()
+        self._ranges = keep
+        
+    def _lookup(self, start, end):
+        for range_start, range_data in self._ranges:
+            if range_start <= start and end <= range_start + len(range_data):
+                return range_data[start - range_start:end - range_start]
+        return None
+        
+    def read(self, length=-1):
+        position = self._position
+        end = self._size
+        if length >= 0:
+            end = min(position + length, end)
+        if end <= position:
+            return ''
+        
+        data = self._lookup(position, end)
+        if data is None:
+            self._fetch(position, end)
+            data = self._lookup(position, end)
+            
+            # The server returned less data than requested
+            if data is None:
+                raise IOError("Unable to read %d bytes at offset %d" % (
+                    end - position, position))
+        
+        self._position = position + len(data)
+        return data
+    
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self._position
+        elif whence == 2:
+            position += self._size
+        self._position = position
+        
+    def tell(self):
+        return self._position
+    
+    def close(self):
+        self._ranges = []
+        self._fetcher.close()
+    
+    def get_size(self):
+        return self._size
+
+
+class HTTPRangeFetcher(object):
+    """ Fetch byte ranges of a http or https url with Range requests over one
+        persistent connection.
+        
+        When the server ignores the Range header the body of the response is
+        read only as far as the fetched ranges require, at most max_content
+        bytes. Fetching data beyond that raises IOError. """
+    
+    _content_range = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+    
+    def __init__(self, url, timeout=30, max_content=64 * 1024 * 1024):
+        # Imported here since most probes are of local files
+        import httplib
+        import urlparse
+        
+        parts = urlparse.urlsplit(url)
+        if parts.scheme == 'https':
+            connection_class = httplib.HTTPSConnection
+        elif parts.scheme == 'http':
+            connection_class = httplib.HTTPConnection
+        else:
+            raise IOError("Unsupported url scheme '%s'" % parts.scheme)
+        
+        self._connection = connection_class(parts.netloc, timeout=timeout)
+        self._path = parts.path or '/'
+        if parts.query:
+            self._path += '?' + parts.query
+        
+        self.max_content = max_content
+        self.size = None
+        
+        # The part of the body read so far and the response, when the server
+        # ignored the Range header and sends the complete file
+        self._content = None
+        self._response = None
+        
+    def fetch(self, start, length):
+        if length <= 0:
+            return ''
+        
+        if self._content is not None:
+            return self._read_content(start, length)
+        
+        import httplib
+        try:
+            self._connection.request('GET', self._path, headers={
+                'Range': 'bytes=%d-%d' % (start, start + length - 1)})
+            response = self._connection.getresponse()
+            if response.status != 200:
+                data = response.read()
+        except (httplib.HTTPException, EnvironmentError), err:
+            self._connection.close()
+            raise IOError("Range request failed: %s" % err)
+        
+        # The server ignored the Range header and sends the complete file
+        if response.status == 200:
+            content_length = response.getheader('content-length', '')
+            if content_length.isdigit():
+                self.size = int(content_length)
+            self._content = bytearray()
+            self._response = response
+            return self._read_content(start, length)
+        
+        if response.status == 206:
+            match = self._content_range.match(
+                response.getheader('content-range', ''))
+            if match and match.group(3) != '*':
+                self.size = int(match.group(3))
+            return data
+        
+        # Range starts beyond the end of the file
+        if response.status == 416:
+            match = self._content_range.match(
+                response.getheader('content-range', '').replace('*', '0-0'))
+            if match:
+                self.size = int(match.group(3))
+            return ''
+        
+        raise IOError("Range request failed: %d %s" % (response.status,
+                                                       response.reason))
+        
+    def _read_content(self, start, length):
+        """ Return length bytes at start of the body of the response, which
+            is read as far as needed. Without a Content-Length the complete
+            body is read to learn the size of the file. """
+        content = self._content
+        end = start + length
+        if self._response is None:
+            return str(content[start:end])
+        
+        if self.size is None:
+            end = self.max_content
+        else:
+            end = min(end, self.size)
+        if end > self.max_content:
+            raise IOError("Server doesn't support range requests, unable "
+                          "to read beyond %d bytes" % self.max_content)
+        
+        import httplib
+        more = ''
+        try:
+            if end > len(content):
+                wanted = end - len(content)
+                data = self._response.read(wanted)
+                content.extend(data)
+                if len(data) < wanted:
+                    self._response = None
+            
+            if self.size is None and self._response is not None:
+                more = self._response.read(1)
+                self._response = None
+        except (httplib.HTTPException, EnvironmentError), err:
+            self._connection.close()
+            self._response = None
+            raise IOError("Request failed: %s" % err)
+        
+        if more:
+            self._connection.close()
+            raise IOError("Server doesn't support range requests, unable to "
+                          "read beyond %d bytes" % self.max_content)
+        if self.size is None:
+            self.size = len(content)
+        return str(content[start:start + length])
+    
+    def close(self):
+        self._content = None
+        self._response = None
+        self._connection.close()
@@ -0,0 +1,61 @@
+""" I/O accounting for BinaryStream. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+class IOStats(object):
+    """ Counters for the I/O done through one or more BinaryStreams. A stream
+        and the subsegments created from it update the same object.
+        
+        The cache_hits and cache_misses of the block cache of a file opened
+        with blocks (see factory.create_filestream()) are added when the
+        stream is closed."""
+    __slots__ = ['bytes_read', 'reads', 'seeks', 'backward_seeks',
+                 'subsegments', 'max_read', 'cache_hits', 'cache_misses']
+    
+    def __init__(self):
+        self.bytes_read = 0
+        self.reads = 0
+        self.seeks = 0
+        self.backward_seeks = 0
+        self.subsegments = 0
+        self.max_read = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def as_dict(self):
+        return dict([(key, getattr(self, key)) for key in self.__slots__])
+    
+    def __repr__(self):
+        buffer  = "IOStats:\n"
+        buffer += " %-30s: %s\n" % ("Bytes read", self.bytes_read)
+        buffer += " %-30s: %s\n" % ("Read calls", self.reads)
+        buffer += " %-30s: %s\n" % ("Seeks", self.seeks)
+        buffer += " %-30s: %s\n" % ("Backward seeks", self.backward_seeks)
+        buffer += " %-30s: %s\n" % ("Subsegments", self.subsegments)
+        buffer += " %-30s: %s\n" % ("Largest read", self.max_read)
+        buffer += " %-30s: %s\n" % ("Block cache hits", self.cache_hits)
+        buffer += " %-30s: %s\n" % ("Block cache misses", self.cache_misses)
+        return buffer
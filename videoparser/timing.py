@@ -0,0 +1,100 @@
+""" Timing of the phases of a probe. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+# 
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+# 
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import time
+
+
+class PhaseTimer(object):
+    """ Times the phases of one probe and passes each of them to
+        callback(filename, phase, plugin, seconds, success) when it ends.
+        
+        The phases are:
+            open      opening the file and creating the stream
+            sniff     reading the start of the file and matching signatures
+            parse     an attempt to parse the file with plugin, success is
+                      False when the plugin failed or raised an exception
+            tree      reading the headers into the tree of the plugin
+            extract   extracting the streams from the tree
+            probe     the whole probe, success is False when no plugin
+                      parsed the file
+        
+        plugin is the name of the plugin during parse, tree and extract and
+        None for the other phases. A phase which raises an exception is
+        passed with success False before the exception propagates.
+        
+        The timer of a probe is the timer attribute of its streams, None
+        when the probe is not timed. The plugins time their phases with
+        span(stream.timer, phase), which does nothing without a timer."""
+    __slots__ = ['callback', 'filename', 'plugin', 'start']
+    
+    def __init__(self, callback, filename):
+        self.callback = callback
+        self.filename = filename
+        self.plugin = None
+        
+        # Start of the probe
+        self.start = time.time()
+    
+    def record(self, phase, start, success=True):
+        """ Pass phase, which started at time start, to the callback. """
+        self.callback(self.filename, phase, self.plugin, time.time() - start,
+                      success)
+
+
+class _Span(object):
+    __slots__ = ['timer', 'phase', 'start']
+    
+    def __init__(self, timer, phase):
+        self.timer = timer
+        self.phase = phase
+    
+    def __enter__(self):
+        self.start = time.time()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.record(self.phase, self.start, exc_type is None)
+        return False
+
+
+class _NullSpan(object):
+    __slots__ = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_null_span = _NullSpan()
+
+
+def span(timer, phase):
+    """ Return a context manager which times phase with timer, a PhaseTimer
+        or None when the probe is not timed. """
+    if timer is None:
+        return _null_span
+    return _Span(timer, phase)
@@ -33,11 +33,25 @@ from videoparser.version import version as __version__
 __all__ = ['VideoFile', 'VideoStream', 'AudioStream']
 __author__ = "Michael van Tellingen <michaelvantellingen at gmail.com>"
 
+
+def _seconds(duration):
+    """ Duration of a stream in seconds, streams without duration have 0. """
+    if isinstance(duration, datetime.timedelta):
+        return duration.total_seconds()
+    return duration
+
 class VideoFile(object):
     def __init__(self):
         self._streams = {}
         self._format = ''
         
+        # streams.IOStats of the probe, if requested from the VideoParser
+        self.io_stats = None
+        
+        # Set by the VideoParser when reading the file failed, a probe
+        # without result is then not cached
+        self._io_error = False
+        
     def _add_stream(self, stream, index=None):
         if index is None:
             index = len(self._streams) + 1
@@ -71,6 +85,15 @@ class VideoFile(object):
         
         return buf
     
+    def as_dict(self):
+        """ Return the container and streams as a dict of plain values, for
+            example to write them as JSON. """
+        streams = []
+        for stream_index in sorted(self._streams):
+            info = self._streams[stream_index].as_dict()
+            info['index'] = stream_index
+            streams.append(info)
+        return {'container': self._format, 'streams': streams}
     
     def get_video_streams(self):
         for stream_id in self._streams:
@@ -125,6 +148,11 @@ class VideoStream(object):
         return "codec: %s, length: %s, resolution: %dx%d, fps: %s" % (
             self._codec, self._duration, self._width, self._height, self._framerate)
 
+    def as_dict(self):
+        return {'type': self.type, 'codec': self._codec,
+                'duration': _seconds(self._duration), 'width': self._width,
+                'height': self._height, 'framerate': self._framerate}
+
 
     def get_resolution(self):
         return (self._width, self._height)
@@ -176,6 +204,13 @@ class AudioStream(object):
             self._codec, self._duration, self._channels, self._sample_rate,
             self._bitrate, self._bits_per_sample)
 
+    def as_dict(self):
+        return {'type': self.type, 'codec': self._codec,
+                'duration': _seconds(self._duration),
+                'channels': self._channels, 'sample_rate': self._sample_rate,
+                'bitrate': self._bitrate,
+                'bits_per_sample': self._bits_per_sample}
+
     
         
 